@@ -0,0 +1,365 @@
+""" Caching helpers for Rating Sliders.
+
+    Stimulus analysis results are expensive to compute
+    on long files, so they are memoized per file. Files
+    are identified by their absolute path, size and
+    modification time: if a stimulus is edited on disk,
+    the old entry is simply never looked up again. Where
+    results must survive renames or copies, files are
+    identified by a digest of their contents instead.
+
+    Compressed stimuli (FLAC, Ogg, ...) are decoded once
+    per machine into a local on-disk cache of .wav files,
+    keyed by content digest, and read at .wav speed after
+    that (see read_audio).
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+# Import science packages
+from scipy.io import wavfile
+# Import custom modules
+import shards
+# Import audio packages (optional: only needed to decode
+# compressed formats)
+try:
+    import soundfile as sf
+except (ImportError, OSError):
+    sf = None
+
+
+WAV_EXTENSIONS = ('.wav',)
+COMPRESSED_EXTENSIONS = ('.flac', '.ogg', '.oga', '.opus', '.mp3')
+AUDIO_EXTENSIONS = WAV_EXTENSIONS + COMPRESSED_EXTENSIONS
+
+# Local cache of decoded stimuli
+CACHE_DIR = Path.home() / 'rating_tool_cache'
+
+
+def stat_key(file_path):
+    """ Return a hashable key identifying the current
+        contents of FILE_PATH without reading it.
+    """
+    st = os.stat(file_path)
+    return (os.path.abspath(file_path), st.st_size, st.st_mtime_ns)
+
+
+class MemoCache:
+    """ A small thread-safe least-recently-used cache.
+
+        MAXSIZE: the maximum number of entries to keep.
+            The oldest entry is dropped when full.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key, default=None):
+        """ Return the cached value for KEY, or DEFAULT """
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+
+    def put(self, key, value):
+        """ Store VALUE under KEY """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+    def clear(self):
+        """ Remove all entries """
+        with self._lock:
+            self._data.clear()
+
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# Content digests, keyed by stat_key
+_digests = MemoCache(maxsize=4096)
+
+
+def file_digest(file_path, chunk_size=2**20):
+    """ Return the SHA-256 hex digest of a file's contents.
+        Digests are memoized by stat_key, so an unchanged
+        file is only read once per process.
+    """
+    key = stat_key(file_path)
+    digest = _digests.get(key)
+    if digest is not None:
+        return digest
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _digests.put(key, digest)
+    return digest
+
+
+def is_audio_file(filename):
+    """ True if FILENAME has a supported audio extension """
+    return os.path.splitext(filename)[1].lower() in AUDIO_EXTENSIONS
+
+
+class DecodeCache:
+    """ An on-disk cache of decoded stimuli.
+
+        Each compressed file is decoded block by block into
+        CACHE_DIR/<content digest>.wav. A small index maps
+        (path, size, mtime) to digests, so files on network
+        shares are not re-read just to be hashed in later
+        sessions. Files are written under a temporary name
+        and renamed, so several processes (or booths) can
+        share one cache directory.
+
+        New index entries are appended to index.log (one
+        JSON object per line), so adding one is O(1). The
+        log is folded into index.json when a process loads
+        the index and finds the log has grown past
+        COMPACT_ENTRIES lines.
+    """
+    COMPACT_ENTRIES = 1000
+
+    def __init__(self, cache_dir=CACHE_DIR, block_size=2**16):
+        self.cache_dir = Path(cache_dir)
+        self.block_size = block_size
+        self._index_path = self.cache_dir / 'index.json'
+        self._log_path = self.cache_dir / 'index.log'
+        # Lock a separate file: index.json is replaced
+        self._lock_path = self.cache_dir / 'index.lock'
+        self._index = None
+        self._log_pos = 0 # bytes of index.log merged so far
+        self._lock = threading.Lock()
+
+
+    def _load_index(self):
+        """ Read the digest index once per process """
+        if self._index is None:
+            self._index = self._read_index()
+            self._log_pos = 0
+            if self._read_log() > self.COMPACT_ENTRIES:
+                self._compact()
+        return self._index
+
+
+    def _read_index(self):
+        """ The compacted index as currently stored on disk """
+        try:
+            with open(self._index_path, 'r') as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+
+    def _read_log(self):
+        """ Merge log entries added since the last call
+            (by any process) into the loaded index. Returns
+            the number of entries read.
+        """
+        try:
+            with open(self._log_path, 'rb') as fh:
+                if os.fstat(fh.fileno()).st_size < self._log_pos:
+                    # Another process compacted the log
+                    self._index.update(self._read_index())
+                    self._log_pos = 0
+                fh.seek(self._log_pos)
+                data = fh.read()
+        except OSError:
+            return 0
+        # Leave a line still being written for next time
+        data = data[:data.rfind(b'\n') + 1]
+        self._log_pos += len(data)
+        entries = _parse_log(data)
+        self._index.update(entries)
+        return len(entries)
+
+
+    def _append_index(self, entries):
+        """ Add ENTRIES to the stored index """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(json.dumps({key: value}) + '\n'
+            for key, value in entries.items())
+        with open(self._lock_path, 'a+') as lock_fh:
+            with shards.locked(lock_fh):
+                with open(self._log_path, 'a') as fh:
+                    fh.write(lines)
+
+
+    def _compact(self):
+        """ Fold index.log into index.json. Other processes
+            may be appending, so both are re-read under the
+            lock; index.json is replaced atomically.
+        """
+        with open(self._lock_path, 'a+') as lock_fh:
+            with shards.locked(lock_fh):
+                index = self._read_index()
+                try:
+                    with open(self._log_path, 'rb') as fh:
+                        index.update(_parse_log(fh.read()))
+                except OSError:
+                    pass
+                tmp = self._index_path.with_suffix(f'.{uuid.uuid4().hex}.tmp')
+                with open(tmp, 'w') as fh:
+                    json.dump(index, fh)
+                os.replace(tmp, self._index_path)
+                open(self._log_path, 'w').close()
+        self._index.update(index)
+        self._log_pos = 0
+
+
+    def digest(self, file_path):
+        """ Content digest of FILE_PATH, using the index
+            where the file is unchanged.
+        """
+        key = '|'.join(str(x) for x in stat_key(file_path))
+        with self._lock:
+            digest = self._load_index().get(key)
+            if digest is None:
+                # Another process may have hashed it meanwhile
+                self._read_log()
+                digest = self._index.get(key)
+        if digest is None:
+            digest = file_digest(file_path)
+            with self._lock:
+                self._index[key] = digest
+                self._append_index({key: digest})
+        return digest
+
+
+    def cached_path(self, file_path):
+        """ Path of the decoded .wav copy of FILE_PATH
+            (which may not exist yet)
+        """
+        return self.cache_dir / f'{self.digest(file_path)}.wav'
+
+
+    def decoded_path(self, file_path):
+        """ Return the path of a decoded .wav copy of
+            FILE_PATH, decoding it first if needed.
+        """
+        out = self.cached_path(file_path)
+        if not out.exists():
+            _, blocks = self.decode_blocks(file_path, out)
+            for _ in blocks:
+                pass
+        return out
+
+
+    def decode_blocks(self, file_path, out, block_size=None):
+        """
+            Decode FILE_PATH to OUT one block at a time.
+            Returns (fs, blocks): BLOCKS yields each block
+            (frames first, int16 or float32, like the .wav
+            written) as it is decoded, so callers can use
+            the audio in the same pass. OUT is in place once
+            BLOCKS is exhausted.
+        """
+        if sf is None:
+            raise ImportError(
+                "The soundfile package is required to read "
+                f"compressed audio: {file_path}")
+        fs = sf.info(file_path).samplerate
+        return fs, self._decode(file_path, out, block_size or self.block_size)
+
+
+    def _decode(self, file_path, out, block_size):
+        """ Generator behind decode_blocks """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_suffix(f'.{uuid.uuid4().hex}.tmp')
+        try:
+            with sf.SoundFile(file_path) as src:
+                # Keep 16-bit sources as 16-bit; everything
+                # else (24-bit, lossy) is stored as float32
+                if src.subtype == 'PCM_16':
+                    subtype, dtype = 'PCM_16', 'int16'
+                else:
+                    subtype, dtype = 'FLOAT', 'float32'
+                with sf.SoundFile(tmp, 'w', samplerate=src.samplerate,
+                channels=src.channels, subtype=subtype, format='WAV') as dst:
+                    for block in src.blocks(blocksize=block_size, 
+                    dtype=dtype, always_2d=True):
+                        dst.write(block)
+                        yield block
+            os.replace(tmp, out)
+        finally:
+            # Decoding failed or was abandoned
+            if tmp.exists():
+                tmp.unlink()
+
+
+def _parse_log(data):
+    """ Index entries from index.log contents (bytes).
+        Damaged lines (e.g., from a crash) are skipped.
+    """
+    entries = {}
+    for line in data.splitlines():
+        try:
+            entries.update(json.loads(line))
+        except (ValueError, TypeError):
+            continue
+    return entries
+
+
+# Shared decode cache
+decode_cache = DecodeCache()
+
+
+def read_audio(file_path, mmap=False):
+    """ Read any supported audio file. Returns (fs, data)
+        like scipy.io.wavfile.read. Compressed files are
+        read from the decode cache. With MMAP, the data
+        are memory-mapped where the file format allows.
+    """
+    if os.path.splitext(file_path)[1].lower() in COMPRESSED_EXTENSIONS:
+        file_path = decode_cache.decoded_path(file_path)
+    if mmap:
+        try:
+            return wavfile.read(file_path, mmap=True)
+        except ValueError:
+            # 24-bit and some extensible files can't be mapped
+            pass
+    return wavfile.read(file_path)
+
+
+def read_blocks(file_path, block_size):
+    """
+        Read any supported audio file in blocks of
+        BLOCK_SIZE frames. Returns (fs, blocks), with
+        blocks as read_audio would return them (int or
+        float). A compressed file that isn't in the decode
+        cache yet is decoded and cached in the same pass.
+    """
+    if os.path.splitext(file_path)[1].lower() in COMPRESSED_EXTENSIONS:
+        out = decode_cache.cached_path(file_path)
+        if not out.exists():
+            return decode_cache.decode_blocks(file_path, out, block_size)
+        file_path = out
+    fs, data = read_audio(file_path, mmap=True)
+    return fs, (data[start:start + block_size]
+        for start in range(0, len(data), block_size))
@@ -0,0 +1,205 @@
+""" Waveform envelope pyramids for stimulus preview.
+
+    Plotting every sample of a multi-minute stimulus is
+    far too slow, so each stimulus gets a min/max envelope
+    at several decimation levels (64, 256, 1024, ...
+    samples per bin), built in one streaming pass over the
+    file. A plot then only needs the level whose bins in
+    view roughly match the screen width.
+
+    Pyramids are stored next to the decoded-audio cache
+    (audiocache.CACHE_DIR/envelopes), keyed by file path,
+    size and modification time (audiocache.stat_key), so
+    each file is read only once, to build its pyramid.
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import Future
+
+# Import science packages
+import numpy as np
+
+# Import custom modules
+import audiocache
+import loudness
+
+
+BASE_DECIMATION = 64 # samples per bin at the finest level
+LEVEL_FACTOR = 4 # bins merged per step up the pyramid
+MIN_BINS = 256 # stop once a level has fewer bins than this
+
+ENVELOPE_DIR = audiocache.CACHE_DIR / 'envelopes'
+
+# Loaded pyramids, keyed by stat_key
+_pyramids = audiocache.MemoCache(maxsize=64)
+# Pyramids being loaded or built: stat_key -> Future
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+class EnvelopePyramid:
+    """ Min/max envelopes of one stimulus at several
+        decimation levels. All channels are combined.
+
+        FS: sampling rate of the stimulus
+        FRAMES: number of samples per channel
+        LEVELS: list of (decimation, mins, maxs), finest
+            first
+    """
+    def __init__(self, fs, frames, levels):
+        self.fs = fs
+        self.frames = frames
+        self.levels = levels
+
+
+    @classmethod
+    def from_blocks(cls, fs, blocks):
+        """ Build a pyramid from an iterable of float
+            blocks (frames first). Every block except the
+            last must be a multiple of BASE_DECIMATION long.
+        """
+        frames = 0
+        mins = []
+        maxs = []
+        for block in blocks:
+            frames += len(block)
+            if block.ndim > 1:
+                block_min = block.min(axis=1)
+                block_max = block.max(axis=1)
+            else:
+                block_min = block_max = block
+            # Whole bins in one reduction, then any partial bin
+            n_full = len(block) // BASE_DECIMATION * BASE_DECIMATION
+            if n_full:
+                mins.append(block_min[:n_full].reshape(-1, BASE_DECIMATION).min(axis=1))
+                maxs.append(block_max[:n_full].reshape(-1, BASE_DECIMATION).max(axis=1))
+            if n_full < len(block):
+                mins.append(block_min[n_full:].min(keepdims=True))
+                maxs.append(block_max[n_full:].max(keepdims=True))
+
+        if mins:
+            level_min = np.concatenate(mins).astype(np.float32)
+            level_max = np.concatenate(maxs).astype(np.float32)
+        else:
+            level_min = level_max = np.zeros(0, dtype=np.float32)
+
+        levels = [(BASE_DECIMATION, level_min, level_max)]
+        decimation = BASE_DECIMATION
+        while len(level_min) >= MIN_BINS:
+            # Pad with edge values to a whole number of bins
+            pad = -len(level_min) % LEVEL_FACTOR
+            level_min = np.pad(level_min, (0, pad), mode='edge'
+                ).reshape(-1, LEVEL_FACTOR).min(axis=1)
+            level_max = np.pad(level_max, (0, pad), mode='edge'
+                ).reshape(-1, LEVEL_FACTOR).max(axis=1)
+            decimation *= LEVEL_FACTOR
+            levels.append((decimation, level_min, level_max))
+        return cls(fs, frames, levels)
+
+
+    @classmethod
+    def from_file(cls, file_path, block_size=BASE_DECIMATION * 1024):
+        """ Build a pyramid in one pass over an audio file
+            (for a compressed file not decoded yet, the same
+            pass fills the decode cache)
+        """
+        fs, blocks = audiocache.read_blocks(file_path, block_size)
+        return cls.from_blocks(fs, (loudness.to_float(block) 
+            for block in blocks))
+
+
+    def view(self, t0, t1, width):
+        """
+            Return (times, mins, maxs) covering T0 to T1
+            seconds, using the coarsest level that still
+            has at least WIDTH bins in view (or the finest
+            level when zoomed in further).
+        """
+        start = max(0, int(t0 * self.fs))
+        stop = min(self.frames, int(np.ceil(t1 * self.fs)))
+        chosen = self.levels[0]
+        for level in self.levels:
+            if (stop - start) / level[0] < width:
+                break
+            chosen = level
+        decimation, mins, maxs = chosen
+        lo = start // decimation
+        hi = min(len(mins), stop // decimation + 1)
+        times = (np.arange(lo, hi) + 0.5) * decimation / self.fs
+        return times, mins[lo:hi], maxs[lo:hi]
+
+
+    def save(self, file_path):
+        """ Write the pyramid to an .npz file (atomically) """
+        arrays = {'fs': self.fs, 'frames': self.frames}
+        for idx, (decimation, mins, maxs) in enumerate(self.levels):
+            arrays[f'dec_{idx}'] = decimation
+            arrays[f'min_{idx}'] = mins
+            arrays[f'max_{idx}'] = maxs
+        tmp = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp, file_path)
+
+
+    @classmethod
+    def load(cls, file_path):
+        """ Read a pyramid written by save() """
+        with np.load(file_path) as data:
+            levels = []
+            idx = 0
+            while f'dec_{idx}' in data:
+                levels.append((int(data[f'dec_{idx}']),
+                    data[f'min_{idx}'], data[f'max_{idx}']))
+                idx += 1
+            return cls(int(data['fs']), int(data['frames']), levels)
+
+
+def get_pyramid(file_path):
+    """ Return the envelope pyramid for an audio file,
+        building and storing it on first use. Safe to call
+        from several threads: concurrent requests for the
+        same file wait for a single build.
+    """
+    key = audiocache.stat_key(file_path)
+    pyramid = _pyramids.get(key)
+    if pyramid is not None:
+        return pyramid
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        pyramid = _load_or_build(file_path, key)
+        _pyramids.put(key, pyramid)
+        future.set_result(pyramid)
+        return pyramid
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _load_or_build(file_path, key):
+    """ Read a stored pyramid, or build and store one """
+    name = hashlib.sha256('|'.join(str(x) for x in key).encode()).hexdigest()
+    cache_file = ENVELOPE_DIR / f'{name}.npz'
+    if cache_file.exists():
+        return EnvelopePyramid.load(cache_file)
+    pyramid = EnvelopePyramid.from_file(file_path)
+    ENVELOPE_DIR.mkdir(parents=True, exist_ok=True)
+    pyramid.save(cache_file)
+    return pyramid
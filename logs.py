@@ -0,0 +1,151 @@
+""" Logging setup for Rating Sliders.
+
+    Modules log through logging.getLogger(__name__). Records
+    are put on a queue by the calling thread (cheap, never
+    blocks on console or disk) and written by a background
+    listener thread to the console and to a rotating log
+    file in ~/rating_tool_logs.
+
+    Every record carries a trial correlation ID, set when a
+    trial starts (set_trial_id), so play, processing and
+    save events for one trial can be traced across modules.
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import queue
+import uuid
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+LOG_DIR = Path.home() / 'rating_tool_logs'
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s [%(trial_id)s] %(message)s'
+
+# Current trial; a context variable so each asyncio task
+# (server session) can have its own
+_trial_id = contextvars.ContextVar('trial_id', default='-')
+_listener = None
+
+
+def new_trial_id():
+    """ Return a short random correlation ID """
+    return uuid.uuid4().hex[:8]
+
+
+def set_trial_id(trial_id):
+    """ Tag subsequent records from this thread/task with
+        TRIAL_ID (None clears it)
+    """
+    _trial_id.set(trial_id or '-')
+
+
+def get_trial_id():
+    return _trial_id.get()
+
+
+class TrialFilter(logging.Filter):
+    """ Adds the current trial ID to each record. Runs in
+        the emitting thread, before the record is queued.
+    """
+    def filter(self, record):
+        record.trial_id = _trial_id.get()
+        return True
+
+
+def parse_levels(text):
+    """ Parse per-module levels, e.g. 'INFO,models=DEBUG'.
+        A bare level applies to everything (the root).
+    """
+    levels = {}
+    for item in filter(None, (x.strip() for x in text.split(','))):
+        name, _, level = item.rpartition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def check_levels(levels):
+    """ Split LEVELS ({module: level name}) into valid
+        levels and a list of bad 'module=level' entries.
+        The root level is INFO unless validly set.
+    """
+    valid = {'': 'INFO'}
+    bad = []
+    for name, level in levels.items():
+        level = str(level).upper()
+        if level in logging._nameToLevel:
+            valid[name] = level
+        else:
+            bad.append(f"{name}={level}" if name else level)
+    return valid, bad
+
+
+def setup_logging(levels='INFO', filename='rating_tool.log', console=True):
+    """ Route all logging through a queue to a background
+        thread. Safe to call more than once (later calls
+        only update the levels).
+
+        LEVELS: per-module levels (see parse_levels).
+            Unknown level names are logged as warnings and
+            ignored (the root falls back to INFO).
+        FILENAME: log file name in LOG_DIR
+    """
+    global _listener
+    root = logging.getLogger()
+    levels = parse_levels(levels) if isinstance(levels, str) else levels
+    levels, bad = check_levels(levels)
+    root.setLevel(levels[''])
+    for name, level in levels.items():
+        if name:
+            logging.getLogger(name).setLevel(level)
+    if _listener is None:
+        _start_listener(filename, console)
+    if bad:
+        logger.warning("Ignoring unknown log levels: %s (use DEBUG, INFO, "
+            "WARNING, ERROR or CRITICAL)", ', '.join(bad))
+
+
+def _start_listener(filename, console):
+    """ Install the queue handler and start the listener """
+    global _listener
+    root = logging.getLogger()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_DIR / filename, maxBytes=2**20, backupCount=5, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    except OSError:
+        # No writable home directory: console only
+        pass
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(TrialFilter())
+    root.addHandler(queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """ Flush queued records and stop the listener """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,291 @@
+""" Loudness analysis for Rating Sliders.
+
+    Computes integrated loudness (ITU-R BS.1770: K-weighting
+    with absolute and relative gating), short-term and
+    windowed RMS, and peak levels in a single streaming
+    pass over blocks of audio. Only a handful of numbers
+    per 100 ms of audio are kept, so memory stays bounded
+    regardless of stimulus length.
+
+    Created: Oct 18, 2026
+"""
+
+# Import science packages
+import numpy as np
+from scipy import signal
+
+# Import custom modules
+import audiocache
+
+
+# BS.1770 gating constants
+STEP_DUR = 0.1 # 100 ms hop between gating blocks
+GATE_STEPS = 4 # 400 ms gating block (75% overlap)
+SHORT_TERM_STEPS = 30 # 3 s short-term loudness window
+ABSOLUTE_GATE = -70.0 # LUFS
+RELATIVE_GATE = -10.0 # LU below the absolute-gated loudness
+
+# Analysis results, keyed by (file, window)
+_cache = audiocache.MemoCache(maxsize=1024)
+
+
+def k_weighting_sos(fs):
+    """
+        Return second-order sections for the BS.1770
+        K-weighting filter (high shelf followed by high
+        pass) at any sampling rate.
+    """
+    # Stage 1: high shelf
+    f0 = 1681.974450955533
+    G = 3.999843853973347
+    Q = 0.7071752369554196
+    K = np.tan(np.pi * f0 / fs)
+    Vh = 10**(G/20)
+    Vb = Vh**0.4996667741545416
+    a0 = 1 + K/Q + K*K
+    shelf = [
+        (Vh + Vb*K/Q + K*K) / a0,
+        2 * (K*K - Vh) / a0,
+        (Vh - Vb*K/Q + K*K) / a0,
+        1.0,
+        2 * (K*K - 1) / a0,
+        (1 - K/Q + K*K) / a0
+    ]
+
+    # Stage 2: high pass
+    f0 = 38.13547087602444
+    Q = 0.5003270373238773
+    K = np.tan(np.pi * f0 / fs)
+    a0 = 1 + K/Q + K*K
+    highpass = [
+        1.0, -2.0, 1.0,
+        1.0,
+        2 * (K*K - 1) / a0,
+        (1 - K/Q + K*K) / a0
+    ]
+    return np.array([shelf, highpass])
+
+
+def channel_weights(channels):
+    """ BS.1770 channel weights (surrounds of a 5.1
+        layout are boosted, the LFE is ignored).
+    """
+    weights = np.ones(channels)
+    if channels == 6:
+        weights[3] = 0.0
+        weights[4:6] = 1.41
+    return weights
+
+
+def to_float(block):
+    """ Convert a block of wav samples to float64 in
+        the range -1.0 to 1.0.
+    """
+    if block.dtype.kind == 'f':
+        return block.astype(np.float64, copy=False)
+    if block.dtype == np.uint8:
+        return (block.astype(np.float64) - 128) / 128
+    return block.astype(np.float64) / np.iinfo(block.dtype).max
+
+
+def _power2db(power, offset=0.0):
+    """ Convert mean-square values to dB without warnings
+        for digital silence.
+    """
+    with np.errstate(divide='ignore'):
+        return offset + 10 * np.log10(power)
+
+
+class LoudnessMeter:
+    """ A streaming loudness and level meter.
+
+        Feed consecutive blocks of float audio, shaped
+        (frames,) or (frames, channels), to process()
+        and call results() once all blocks are in.
+
+        FS: sampling rate in Hz
+        CHANNELS: number of channels in each block
+        WINDOW: duration (s) of the sliding RMS window
+    """
+    def __init__(self, fs, channels=1, window=3.0):
+        self.fs = fs
+        self.channels = channels
+        self.window = window
+
+        self._sos = k_weighting_sos(fs)
+        self._zi = np.zeros((self._sos.shape[0], 2, channels))
+        self._weights = channel_weights(channels)
+
+        # Samples per 100 ms step and per RMS window
+        self._step = max(1, int(round(STEP_DUR * fs)))
+        self._window_steps = max(1, int(round(window / STEP_DUR)))
+
+        # Running sums for the step currently being filled
+        self._fill = 0
+        self._k_acc = np.zeros(channels)
+        self._sq_acc = np.zeros(channels)
+
+        # Completed per-step mean squares (chunked arrays)
+        self._k_steps = []
+        self._sq_steps = []
+
+        # Whole-signal totals
+        self.frames = 0
+        self._sq_total = np.zeros(channels)
+        self._peak = np.zeros(channels)
+
+
+    def process(self, block):
+        """ Add the next block of float audio """
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        if block.shape[1] != self.channels:
+            raise ValueError(
+                f"Expected {self.channels} channels, got {block.shape[1]}")
+        if len(block) == 0:
+            return
+
+        # Whole-signal statistics
+        sq = np.square(block)
+        self.frames += len(block)
+        self._sq_total += sq.sum(axis=0)
+        np.maximum(self._peak, np.abs(block).max(axis=0), out=self._peak)
+
+        # K-weighted power, carrying filter state across blocks
+        kw, self._zi = signal.sosfilt(self._sos, block, axis=0, zi=self._zi)
+        ksq = np.square(kw)
+
+        # 1. Finish the partially filled step
+        pos = min(self._step - self._fill, len(block))
+        self._k_acc += ksq[:pos].sum(axis=0)
+        self._sq_acc += sq[:pos].sum(axis=0)
+        self._fill += pos
+        if self._fill == self._step:
+            self._k_steps.append(self._k_acc[np.newaxis] / self._step)
+            self._sq_steps.append(self._sq_acc[np.newaxis] / self._step)
+            self._k_acc = np.zeros(self.channels)
+            self._sq_acc = np.zeros(self.channels)
+            self._fill = 0
+
+        # 2. Whole steps in one vectorized reduction
+        n_full = (len(block) - pos) // self._step
+        if n_full:
+            end = pos + n_full * self._step
+            shape = (n_full, self._step, self.channels)
+            self._k_steps.append(ksq[pos:end].reshape(shape).mean(axis=1))
+            self._sq_steps.append(sq[pos:end].reshape(shape).mean(axis=1))
+            pos = end
+
+        # 3. Start a new partial step with the remainder
+        if pos < len(block):
+            self._k_acc += ksq[pos:].sum(axis=0)
+            self._sq_acc += sq[pos:].sum(axis=0)
+            self._fill += len(block) - pos
+
+
+    @staticmethod
+    def _moving_mean(steps, n):
+        """ Mean over every run of N consecutive steps """
+        csum = np.cumsum(np.vstack([np.zeros((1, steps.shape[1])), steps]), axis=0)
+        return (csum[n:] - csum[:-n]) / n
+
+
+    def results(self):
+        """ Return a dictionary of level measurements.
+            Levels are in dB re: full scale (LUFS for
+            loudness values); per-channel values are lists.
+        """
+        if self._k_steps:
+            k_steps = np.vstack(self._k_steps)
+            sq_steps = np.vstack(self._sq_steps)
+        else:
+            k_steps = np.zeros((0, self.channels))
+            sq_steps = np.zeros((0, self.channels))
+
+        # Signals shorter than one gating block are measured
+        # as a single block
+        if len(k_steps) < GATE_STEPS:
+            total = k_steps.sum(axis=0) * self._step + self._k_acc
+            blocks = (total / max(self.frames, 1))[np.newaxis]
+        else:
+            blocks = self._moving_mean(k_steps, GATE_STEPS)
+
+        # Gated integrated loudness
+        block_power = blocks @ self._weights
+        block_lufs = _power2db(block_power, -0.691)
+        gated = block_power[block_lufs > ABSOLUTE_GATE]
+        if len(gated):
+            rel_gate = _power2db(gated.mean(), -0.691) + RELATIVE_GATE
+            gated = block_power[
+                (block_lufs > ABSOLUTE_GATE) & (block_lufs > rel_gate)]
+        integrated = _power2db(gated.mean(), -0.691) if len(gated) else -np.inf
+
+        # Maximum short-term loudness
+        if len(k_steps) >= SHORT_TERM_STEPS:
+            short_term = self._moving_mean(k_steps, SHORT_TERM_STEPS) @ self._weights
+            max_short_term = float(_power2db(short_term.max(), -0.691))
+        else:
+            max_short_term = float(integrated)
+
+        # Maximum windowed RMS per channel
+        if len(sq_steps) >= self._window_steps:
+            windowed = self._moving_mean(sq_steps, self._window_steps).max(axis=0)
+        else:
+            windowed = self._sq_total / max(self.frames, 1)
+
+        return {
+            'fs': self.fs,
+            'channels': self.channels,
+            'frames': self.frames,
+            'integrated_lufs': float(integrated),
+            'max_short_term_lufs': max_short_term,
+            'rms_db': _power2db(self._sq_total / max(self.frames, 1)).tolist(),
+            'max_window_rms_db': _power2db(windowed).tolist(),
+            'peak_db': (2 * _power2db(self._peak)).tolist()
+        }
+
+
+def analyze_array(sig, fs, window=3.0, block_size=2**16, key=None):
+    """ Measure an in-memory float signal block by block.
+        If KEY is given, results are cached under it.
+    """
+    if key is not None:
+        cached = _cache.get((key, window))
+        if cached is not None:
+            return cached
+
+    channels = 1 if sig.ndim == 1 else sig.shape[1]
+    meter = LoudnessMeter(fs, channels, window)
+    for start in range(0, len(sig), block_size):
+        meter.process(sig[start:start+block_size])
+
+    results = meter.results()
+    if key is not None:
+        _cache.put((key, window), results)
+    return results
+
+
+def analyze_file(file_path, window=3.0, block_size=2**16):
+    """
+        Measure an audio file in one streaming pass. The
+        file is memory-mapped where possible, so only one
+        block is converted to float at a time. Results
+        are cached per file.
+    """
+    key = (audiocache.stat_key(file_path), window)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    fs, data = audiocache.read_audio(file_path, mmap=True)
+
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    meter = LoudnessMeter(fs, channels, window)
+    for start in range(0, len(data), block_size):
+        meter.process(to_float(data[start:start+block_size]))
+    del data
+
+    results = meter.results()
+    _cache.put(key, results)
+    return results
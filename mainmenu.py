@@ -27,12 +27,36 @@ class MainMenu(tk.Menu):
             label="Session...",
             command=self._event('<<FileSession>>')
         )
+        file_menu.add_command(
+            label="Preview Stimuli...",
+            command=self._event('<<FilePreview>>')
+        )
+        file_menu.add_command(
+            label="Dashboard...",
+            command=self._event('<<FileDashboard>>')
+        )
         file_menu.add_separator()
         file_menu.add_command(
             label="Quit",
             command=self._event('<<FileQuit>>')
         )
         self.add_cascade(label='File', menu=file_menu)
+        # Diagnostics menu
+        diag_menu = tk.Menu(self, tearoff=False)
+        diag_menu.add_command(
+            label="Start Profiling...",
+            command=self._event('<<DiagnosticsProfileStart>>')
+        )
+        diag_menu.add_command(
+            label="Stop Profiling",
+            command=self._event('<<DiagnosticsProfileStop>>')
+        )
+        diag_menu.add_separator()
+        diag_menu.add_command(
+            label="Compare Snapshots...",
+            command=self._event('<<DiagnosticsCompare>>')
+        )
+        self.add_cascade(label='Diagnostics', menu=diag_menu)
         # Help menu
         help_menu = tk.Menu(self, tearoff=False)
         help_menu.add_command(
@@ -2,9 +2,12 @@
 
 # Import system packages
 import csv
+import logging
 from pathlib import Path
 from datetime import datetime
 import os
+import time
+import zipfile
 # Import data science packages
 import numpy as np
 import matplotlib.pyplot as plt
@@ -18,36 +21,139 @@ from scipy.io import wavfile
 import sounddevice as sd
 # Import custom modules
 from constants import FieldTypes as FT
+import audiocache
+import loudness
+import processing
+import shards
+
+
+logger = logging.getLogger(__name__)
 
 
 class AudioList:
-    """ Get audio files and randomize list """
-    fields = {'Audio List': []}
+    """ Get audio files and randomize the list of trials.
+
+        With 'Stimuli Per Trial' > 1 (e.g., 2 for paired
+        A/B comparisons), trials are defined either by a
+        trial list .csv ('Trial List File': one trial per
+        row, file names in presentation order) or by file
+        name: files sharing a stem up to the last '_'
+        (e.g., pair01_A.wav, pair01_B.wav) form one trial,
+        in name order. Trials are shuffled as units.
+
+        Every trial list row must name 'Stimuli Per Trial'
+        files (the .csv file gets one set of filename
+        columns). Files that are not part of any trial are
+        listed in 'Unused Files'; trial list rows that are
+        skipped (wrong length or missing files) are listed
+        in 'Skipped Trials' as (row, reason) pairs.
+
+        Raises ValueError if the trial list can't be read.
+    """
+    fields = {'Audio List': [], 'Trial List': [], 'Unused Files': [],
+        'Skipped Trials': []}
 
     def __init__(self, sessionpars):
         
         self.sessionpars = sessionpars
+        # Fresh lists for this load
+        self.fields = {key: [] for key in AudioList.fields}
 
-        print("Models_31: Checking for audio files dir...")
+        logger.debug("Checking for audio files dir...")
         # If the file doesn't exist, return
         if not os.path.exists(self.sessionpars['Audio Files Path'].get()):
-            print("Models_34: Not a valid audio files directory!")
+            logger.warning("Not a valid audio files directory: %s", self.sessionpars['Audio Files Path'].get())
             return
         # If a valid path has been given, get the files
-        self.fields['Audio List'] = os.listdir(self.sessionpars['Audio Files Path'].get())
-        random.shuffle(self.fields['Audio List'])
-        print("Models_39: Loaded randomized audio files into AudioList model")
-        #print(self.fields['Audio List'])
+        files = sorted(f for f in 
+            os.listdir(self.sessionpars['Audio Files Path'].get()) 
+            if audiocache.is_audio_file(f))
+
+        n = max(1, self.sessionpars['Stimuli Per Trial'].get())
+        trial_file = self.sessionpars['Trial List File'].get()
+        skipped = []
+        if trial_file:
+            trials, skipped = self.read_trial_list(trial_file, files, n)
+        elif n == 1:
+            trials = [(f,) for f in files]
+        else:
+            trials = self.group_by_stem(files, n)
+        random.shuffle(trials)
+
+        used = {f for trial in trials for f in trial}
+        self.fields['Trial List'] = trials
+        self.fields['Audio List'] = [f for trial in trials for f in trial]
+        self.fields['Unused Files'] = [f for f in files if f not in used]
+        self.fields['Skipped Trials'] = skipped
+        logger.info("Loaded %d randomized trials (%d files) into AudioList model", 
+            len(trials), len(used))
+        if self.fields['Unused Files']:
+            logger.warning("%d file(s) not in any trial: %s", 
+                len(self.fields['Unused Files']), 
+                ', '.join(self.fields['Unused Files']))
+        for row, reason in skipped:
+            logger.warning("Skipped trial list row (%s): %s", reason, ', '.join(row))
+
+
+    @staticmethod
+    def group_by_stem(files, n):
+        """ Trials of N files sharing a name stem (the part
+            before the last '_'). Groups of any other size
+            are left out.
+        """
+        groups = {}
+        for f in files:
+            stem = os.path.splitext(f)[0].rpartition('_')[0] or f
+            groups.setdefault(stem, []).append(f)
+        return [tuple(sorted(group)) for group in groups.values() 
+            if len(group) == n]
+
+
+    @staticmethod
+    def read_trial_list(filename, files, n):
+        """ Read trials of N file names each from a .csv
+            file. A header row, blank cells and blank rows
+            are ignored. Returns (trials, skipped), where
+            skipped holds (row, reason) pairs.
+        """
+        available = set(files)
+        trials = []
+        skipped = []
+        try:
+            with open(filename, 'r', newline='') as fh:
+                rows = list(csv.reader(fh))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            raise ValueError(f"Could not read trial list {filename}: {e}") from e
+
+        for row in rows:
+            row = tuple(cell.strip() for cell in row if cell.strip())
+            if not row:
+                continue
+            if not any(audiocache.is_audio_file(f) for f in row):
+                # Header row
+                continue
+            if len(row) != n:
+                skipped.append((row, f"{len(row)} files, expected {n}"))
+            elif not all(f in available for f in row):
+                skipped.append((row, "missing file(s)"))
+            else:
+                trials.append(row)
+        return trials, skipped
 
 
 class CSVModel:
-    """ CSV file storage """
+    """ CSV file storage. Each instance writes its own
+        shard (file name includes a unique run ID), so
+        several instances never share a file. Use
+        shards.py to merge a session's shards.
+    """
     def __init__(self, sessionpars):
 
         # Initialize sessionpars
         self.sessionpars = sessionpars
 
         self.datestamp = datetime.now().strftime("%Y_%b_%d_%H%M")
+        self.run_id = shards.new_run_id()
 
     # Data dictionary
     fields = {
@@ -57,9 +163,28 @@ class CSVModel:
         }
 
     
+    def get_filename(self):
+        """ Name of this run's .csv shard """
+        base = f"{self.datestamp}_{self.sessionpars['Condition'].get()}_{self.sessionpars['Subject'].get()}.csv"
+        return shards.shard_name(base, self.run_id)
+
+
+    def save_trajectory(self, key, trajectory):
+        """ Append a slider trajectory to the .npz sidecar
+            of the .csv file (same name, .npz extension).
+            Load with np.load(path)[KEY].
+        """
+        sidecar = Path(self.get_filename()).with_suffix('.npz')
+        # Add one .npy member without rewriting the archive
+        with zipfile.ZipFile(sidecar, mode='a', 
+        compression=zipfile.ZIP_DEFLATED) as zf:
+            with zf.open(f"{key}.npy", mode='w') as fh:
+                np.lib.format.write_array(fh, trajectory)
+
+
     def save_record(self, data):
         """ Save a dictionary of data to .csv file """
-        filename = f"{self.datestamp}_{self.sessionpars['Condition'].get()}_{self.sessionpars['Subject'].get()}.csv"
+        filename = self.get_filename()
         self.file = Path(filename)
 
         # Check for write access to store csv
@@ -100,19 +225,164 @@ class CSVModel:
         # See naming convention info above
         # Take everything after the last underscore
         filename_val = all_data["audio_filename"].split("_")[-1]
-        # Remove .wav file extension
-        filename_val = filename_val[:-4]
+        # Remove file extension (.wav, .flac, etc.)
+        filename_val = os.path.splitext(filename_val)[0]
         all_data["filename_value"] = filename_val
+        # Same for additional stimuli in multi-stimulus trials
+        idx = 2
+        while f"audio_filename_{idx}" in all_data:
+            filename_val = all_data[f"audio_filename_{idx}"].split("_")[-1]
+            all_data[f"filename_value_{idx}"] = os.path.splitext(filename_val)[0]
+            idx += 1
+
+        # Tag the row for merging shards in time order
+        all_data["timestamp"] = datetime.now().isoformat(timespec='milliseconds')
+        all_data["run_id"] = self.run_id
 
         # Save combined dict to file
-        newfile = not self.file.exists()
-        with open(self.file, 'a', newline='') as fh:
+        with open(self.file, 'a', newline='') as fh, shards.locked(fh):
+            # Check for a header under the lock
+            fh.seek(0, os.SEEK_END)
+            newfile = fh.tell() == 0
             csvwriter = csv.DictWriter(fh, fieldnames=all_data.keys())
             if newfile:
                 csvwriter.writeheader()
             csvwriter.writerow(all_data)
 
 
+class TrajectoryBuffer:
+    """ Timestamped slider positions for one trial.
+
+        Rows of (time, value per slider) are written into
+        a preallocated array, so recording a slider event
+        creates no new arrays or lists. When CAPACITY rows
+        have been recorded, the oldest rows are overwritten.
+
+        NAMES: the slider names (one column each)
+    """
+    def __init__(self, names, capacity=8192):
+        self.names = list(names)
+        self.capacity = capacity
+        self._data = np.zeros((capacity, len(self.names) + 1))
+        self.start()
+
+
+    def start(self, *values):
+        """ Clear the buffer and restart the trial clock.
+            With VALUES (one per slider), they are recorded
+            as the first row, at t=0.
+        """
+        self._n = 0
+        self._t0 = time.perf_counter()
+        if values:
+            self._data[0, 0] = 0.0
+            self._data[0, 1:] = values
+            self._n = 1
+
+
+    def record(self, *values):
+        """ Record the current value of every slider """
+        row = self._data[self._n % self.capacity]
+        row[0] = time.perf_counter() - self._t0
+        row[1:] = values
+        self._n += 1
+
+
+    def __len__(self):
+        return min(self._n, self.capacity)
+
+
+    def get(self):
+        """ Return the recorded rows in time order as a
+            structured float32 array with fields 't' (s
+            since start, i.e., stimulus onset) and one per
+            slider name.
+        """
+        n = len(self)
+        first = self._n % self.capacity if self._n > self.capacity else 0
+        rows = np.roll(self._data, -first, axis=0)[:n]
+        out = np.empty(n, dtype=[(name, 'f4') for name in ['t'] + self.names])
+        for idx, name in enumerate(out.dtype.names):
+            out[name] = rows[:, idx]
+        return out
+
+
+class RunningStats:
+    """ Running mean and variance (Welford's method), so
+        summaries can be updated in constant time per value.
+    """
+    __slots__ = ('n', 'mean', '_m2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+
+    def add(self, x):
+        """ Add one value """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+
+    @property
+    def variance(self):
+        """ Sample variance (0 for fewer than 2 values) """
+        return self._m2 / (self.n - 1) if self.n > 1 else 0.0
+
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class RatingSummary:
+    """ Running summary of a session's ratings.
+
+        Keeps RunningStats per stimulus and scale, and a 2D
+        histogram of the first two scales (e.g., awareness
+        vs. acceptability). Each new trial costs the same
+        regardless of how many came before.
+
+        NAMES: the rating scale names
+        BINS: histogram bins per axis (over 0-100)
+    """
+    def __init__(self, names, bins=20):
+        self.names = list(names)
+        self.bins = bins
+        self.stimuli = {} # label -> index, in order of first rating
+        self.stats = [] # per stimulus: one RunningStats per scale
+        self.hist = np.zeros((bins, bins), dtype=int)
+
+
+    def add(self, label, ratings):
+        """ Add one trial. Returns the stimulus index. """
+        idx = self.stimuli.setdefault(label, len(self.stimuli))
+        if idx == len(self.stats):
+            self.stats.append([RunningStats() for _ in self.names])
+        for stats, name in zip(self.stats[idx], self.names):
+            stats.add(ratings[name])
+
+        if len(self.names) >= 2:
+            x, y = (min(int(ratings[name] / 100 * self.bins), self.bins - 1)
+                for name in self.names[:2])
+            # Rows are the second scale (y axis)
+            self.hist[y, x] += 1
+        return idx
+
+
+    def means(self, scale):
+        """ Mean rating per stimulus for one scale index """
+        return np.array([s[scale].mean for s in self.stats])
+
+
+    def stds(self, scale):
+        """ Rating standard deviation per stimulus """
+        return np.array([s[scale].std for s in self.stats])
+
+
 class SessionParsModel:
     """ A model for saving session parameters """
     fields = {
@@ -120,6 +390,17 @@ class SessionParsModel:
         'Condition': {'type': 'str', 'value': 'Quiet'},
         'Presentation Level': {'type': 'float', 'value': -50},
         'Speaker Number': {'type': 'int', 'value': 1},
+        'Stimuli Per Trial': {'type': 'int', 'value': 1},
+        'Trial List File': {'type': 'str', 'value': ''},
+        'ISI': {'type': 'float', 'value': 500.0},
+        'Level Reference': {'type': 'str', 'value': 'RMS'},
+        'Ramp Duration': {'type': 'float', 'value': 0.0},
+        'Filter Type': {'type': 'str', 'value': 'None'},
+        'Filter Design': {'type': 'str', 'value': 'IIR'},
+        'Low Cutoff': {'type': 'float', 'value': 250.0},
+        'High Cutoff': {'type': 'float', 'value': 4000.0},
+        'Masker Path': {'type': 'str', 'value': ''},
+        'SNR': {'type': 'float', 'value': 0.0},
         'Audio Files Path': {'type': 'str', 'value': 'Please select a path'}
     }
 
@@ -134,18 +415,18 @@ class SessionParsModel:
 
     def load(self):
         """ Load the settings from the file """
-        print("Models_78: Checking for pars file...")
+        logger.debug("Checking for pars file...")
         # If the file doesn't exist, return
         if not self.filepath.exists():
             return
 
         # Open the file and read in the raw values
-        print("Models_84: File found - reading raw vals from pars file...")
+        logger.debug("File found - reading raw vals from pars file...")
         with open(self.filepath, 'r') as fh:
             raw_values = json.load(fh)
 
         # Don't implicitly trust the raw values; only get known keys
-        print("Models_89: Loading vals into sessionpars model if they match model keys")
+        logger.debug("Loading vals into sessionpars model if they match model keys")
         for key in self.fields:
             if key in raw_values and 'value' in raw_values[key]:
                 raw_value = raw_values[key]['value']
@@ -154,14 +435,14 @@ class SessionParsModel:
 
     def save(self):
         """ Save the current settings to the file """
-        print("Models_153: Writing session pars from model to file...")
+        logger.debug("Writing session pars from model to file...")
         with open(self.filepath, 'w') as fh:
             json.dump(self.fields, fh)
         
     
     def set(self, key, value):
         """ Set a variable value """
-        print("Models_160: Setting sessionpars model fields with running vals...")
+        logger.debug("Setting sessionpars model field %s", key)
         if (
             key in self.fields and 
             type(value).__name__ == self.fields[key]['type']
@@ -174,10 +455,66 @@ class SessionParsModel:
 
 
 
+class ScalesModel:
+    """ A model for the rating scales shown on each trial.
+        Scales can be changed by editing the JSON file in 
+        the user's home directory.
+    """
+    fields = {
+        'Scales': {'type': 'list', 'value': [
+            {'name': 'Awareness Rating',
+            'question': "Please rate how aware you were of the transition:",
+            'anchors': ['Not\nAware', 'Slightly\nAware', 
+                'Somewhat\nAware', 'Moderately\nAware', 'Extremely\nAware']},
+            {'name': 'Acceptability Rating',
+            'question': "Please rate how acceptable the transition was:",
+            'anchors': ['Not\nAcceptable', 'Slightly\nAcceptable', 
+                'Somewhat\nAcceptable', 'Moderately\nAcceptable', 
+                'Extremely\nAcceptable']}
+        ]},
+        'Columns': {'type': 'int', 'value': 1}
+    }
+
+
+    def __init__(self):
+        filename = 'rating_tool_scales.json'
+        # Store scales file in user's home directory
+        self.filepath = Path.home() / filename
+        # Load scales file
+        self.load()
+
+
+    def load(self):
+        """ Load the scales from the file """
+        # If the file doesn't exist, return
+        if not self.filepath.exists():
+            return
+
+        # Open the file and read in the raw values
+        with open(self.filepath, 'r') as fh:
+            raw_values = json.load(fh)
+
+        # Don't implicitly trust the raw values; only get known keys
+        for key in self.fields:
+            if key in raw_values and 'value' in raw_values[key]:
+                raw_value = raw_values[key]['value']
+                self.fields[key]['value'] = raw_value
+
+
+    def save(self):
+        """ Save the current scales to the file """
+        with open(self.filepath, 'w') as fh:
+            json.dump(self.fields, fh, indent=2)
+
+
 class SettingsModel:
     """ A model for saving settings """
     fields = {
-        'autofill date': {'type': 'bool', 'value': True}
+        'autofill date': {'type': 'bool', 'value': True},
+        # e.g. 'INFO' or 'INFO,models=DEBUG' (see logs.py)
+        'log levels': {'type': 'str', 'value': 'INFO'},
+        # Mainloop delays longer than this are reported (see watchdog.py)
+        'stall threshold ms': {'type': 'int', 'value': 200}
     }
 
 
@@ -185,7 +522,7 @@ class SettingsModel:
         filename = 'rating_tool.json'
         # Store settings file in user's home directory
         self.filepath = Path.home() / filename
-        print(self.filepath)
+        logger.debug("Settings file: %s", self.filepath)
         # Load settings file
         self.load()
 
@@ -211,7 +548,7 @@ class SettingsModel:
         """ Save the current settings to the file """
         with open(self.filepath, 'w') as fh:
             json.dump(self.fields, fh)
-            print("Settings file written")
+            logger.debug("Settings file written")
 
     
     def set(self, key, value):
@@ -226,10 +563,16 @@ class SettingsModel:
 
 
 class Audio:
-    """ An object for use with .wav files. Audio objects 
-        can read a given .wav file, handle audio data type 
-        conversion, and store information about a .wav 
-        file.
+    """ An object for use with audio files. Audio objects 
+        can read a given .wav (or compressed) file, handle 
+        audio data type conversion, and store information 
+        about the file.
+
+        LEVEL_REF selects how the presentation level is
+        applied: 'RMS' (per-channel RMS, see setRMS) or
+        'LUFS' (integrated loudness, see setLUFS).
+        CHAIN is an optional processing.ProcessingChain
+        applied before leveling.
     """
     # Dictionary of data types and ranges for conversions
     wav_dict = {
@@ -239,22 +582,25 @@ class Audio:
         'uint8': (0, 255)
     }
 
-    def __init__(self, file_path, level):
+    def __init__(self, file_path, level, level_ref='RMS', chain=None):
         # Parse file path
         self.directory = file_path.split(os.sep) # path only
         self.name = str(file_path.split(os.sep)[-1]) # file name only
         self.file_path = file_path
         self.level = level
+        self.level_ref = level_ref
+        self.chain = chain
 
-        # Read audio file
-        fs, audio_file = wavfile.read(self.file_path)
+        # Read audio file (compressed files are decoded once
+        # into the local cache)
+        fs, audio_file = audiocache.read_audio(self.file_path)
 
         # Get number of channels
         try:
             self.channels = audio_file.shape[1]
         except IndexError:
             self.channels = 1
-        print(f"Number of channels: {self.channels}")
+        logger.debug("Number of channels: %d", self.channels)
 
         # Assign audio file attributes
         self.fs = fs
@@ -265,11 +611,16 @@ class Audio:
         # Get data type
         #self.data_type = np.dtype(audio_file[0])
         self.data_type = audio_file.dtype
-        print(f"Incoming audio data type: {self.data_type}")
+        logger.debug("Incoming audio data type: %s", self.data_type)
 
         # Immediately convert to float64 for processing
         self.convert_to_float()
 
+        # Apply session processing (filter, masker, ramps)
+        if self.chain is not None and not self.chain.is_empty():
+            self.working_audio = processing.process(
+                self.file_path, self.working_audio, self.fs, self.chain)
+
 
     def convert_to_float(self):
         """ Convert original audio data type to float64 
@@ -285,22 +636,31 @@ class Audio:
             self.working_audio = sig
 
 
+    def leveled(self):
+        """ Return the working audio set to the presentation
+            level, frames first (does not change working_audio).
+        """
+        if self.level_ref == 'LUFS':
+            return self.setLUFS(self.working_audio, self.level)
+        elif self.channels == 1:
+            return self.setRMS(self.working_audio, self.level)
+        elif self.channels > 1:
+            left = self.setRMS(self.working_audio[:,0], self.level)
+            right = self.setRMS(self.working_audio[:,1], self.level)
+            return np.array([left, right]).T
+
+
     def play(self):
         """ Present working audio """
         #print(f"Presenting audio data type: {np.dtype(self.working_audio[0])}")
-        print(f"Presenting audio data type: {self.working_audio.dtype}")
+        logger.debug("Presenting %s (%s)", self.name, self.working_audio.dtype)
         # plt.subplot(1,3,1)
         # plt.plot(self.original_audio)
         # plt.subplot(1,3,2)
         # plt.plot(self.working_audio)
 
-        if self.channels == 1:
-            sig = self.setRMS(self.working_audio, self.level)
-            self.working_audio = sig
-        elif self.channels > 1:
-            left = self.setRMS(self.working_audio[:,0], self.level)
-            right = self.setRMS(self.working_audio[:,1], self.level)
-            self.working_audio = np.array([left, right])
+        # Leveled audio is stored channels first
+        self.working_audio = self.leveled().T
         # plt.subplot(1,3,3)
         # plt.plot(self.working_audio)
         # plt.show()
@@ -318,7 +678,7 @@ class Audio:
             sig = np.round(sig)
         # 3. Convert back to original data type
         sig = sig.astype(self.data_type)
-        print(f"Converted data type: {str(type(sig[0]))}")
+        logger.debug("Converted data type: %s", sig.dtype)
         self.working_audio = sig
 
 
@@ -367,6 +727,34 @@ class Audio:
         return theRMS
 
 
+    def loudness(self):
+        """ Return cached loudness measurements for this
+            file (see loudness.analyze_file), or for the
+            processed signal if a chain was applied.
+        """
+        if self.chain is None or self.chain.is_empty():
+            return loudness.analyze_file(self.file_path)
+        return loudness.analyze_array(self.working_audio, self.fs,
+            key=processing.processing_key(self.file_path, self.chain))
+
+
+    def setLUFS(self, sig, amp):
+        """
+            Set the integrated loudness of a signal.
+
+            SIG: a 1-channel or multi-channel signal
+            AMP: the desired integrated loudness (LUFS).
+                The same gain is applied to every channel,
+                so level differences between channels
+                are preserved.
+        """
+        lufs = self.loudness()['integrated_lufs']
+        # Digital silence can't be leveled
+        if not np.isfinite(lufs):
+            return sig
+        return sig * self.db2mag(amp - lufs)
+
+
     def setRMS(self, sig, amp, eq='n'):
         """
             Set RMS level of a 1-channel or 2-channel signal.
@@ -450,3 +838,66 @@ class Audio:
 
             sigBothAdj = np.array([sigAdjLeft, sigAdjRight])
             return sigBothAdj
+
+
+class SequencePlayer:
+    """ Present several stimuli back to back on one output
+        stream, separated by a sample-accurate silent gap.
+
+        Buffers are read directly from the stream callback,
+        so no concatenated copy of the trial is made and
+        there is no device restart (or click) between them.
+
+        BUFFERS: leveled float arrays, frames first. Mono
+            buffers are sent to every output channel.
+        FS: sampling rate shared by all buffers
+        ISI: inter-stimulus interval in seconds
+    """
+    def __init__(self, buffers, fs, isi=0.0):
+        self.fs = fs
+        self.buffers = [
+            b[:, np.newaxis] if b.ndim == 1 else b for b in buffers]
+        self.channels = max(b.shape[1] for b in self.buffers)
+        gap = int(round(isi * fs))
+
+        # Start frame of each buffer in the sequence
+        self.schedule = []
+        start = 0
+        for buf in self.buffers:
+            self.schedule.append((start, buf))
+            start += len(buf) + gap
+        self.total = start - gap
+        self._pos = 0
+        self._stream = None
+
+
+    def _callback(self, outdata, frames, time, status):
+        """ Fill one block of output from the schedule """
+        outdata.fill(0)
+        pos = self._pos
+        for start, buf in self.schedule:
+            lo = max(pos, start)
+            hi = min(pos + frames, start + len(buf))
+            if lo < hi:
+                outdata[lo-pos:hi-pos] = buf[lo-start:hi-start]
+        self._pos += frames
+        if self._pos >= self.total:
+            raise sd.CallbackStop
+
+
+    def play(self):
+        """ Start playback (returns immediately) """
+        self.stop()
+        self._pos = 0
+        self._stream = sd.OutputStream(samplerate=self.fs,
+            channels=self.channels, dtype='float32',
+            callback=self._callback)
+        self._stream.start()
+
+
+    def stop(self):
+        """ Stop playback and release the stream """
+        if self._stream is not None:
+            self._stream.abort()
+            self._stream.close()
+            self._stream = None
@@ -0,0 +1,280 @@
+""" Stimulus processing chain for Rating Sliders.
+
+    Applies optional band-limiting, background noise
+    (masker) mixing at a target SNR and cosine onset/
+    offset ramps to a stimulus at presentation time, so
+    conditions can be changed from the Session dialog
+    instead of re-rendering stimuli in other tools.
+
+    Processing order: filter -> masker -> ramps. Each
+    stage runs block by block (filter state or FIR tails
+    are carried across blocks), and processed signals are
+    memoized by (file digest, chain parameters).
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import os
+
+# Import science packages
+import numpy as np
+from scipy import signal
+
+# Import custom modules
+import audiocache
+import loudness
+
+
+FILTER_TYPES = ['None', 'Lowpass', 'Highpass', 'Bandpass']
+FILTER_DESIGNS = ['IIR', 'FIR']
+
+# Processed signals and decoded maskers
+_processed = audiocache.MemoCache(maxsize=8)
+_maskers = audiocache.MemoCache(maxsize=4)
+
+
+class ProcessingChain:
+    """ A set of processing parameters for one session.
+
+        RAMP_MS: duration of cosine onset/offset ramps (ms)
+        FILTER_TYPE: one of FILTER_TYPES
+        FILTER_DESIGN: 'IIR' (Butterworth, sosfilt) or
+            'FIR' (windowed sinc, FFT overlap-add)
+        LOW_CUTOFF, HIGH_CUTOFF: band edges in Hz. Lowpass
+            uses HIGH_CUTOFF and highpass uses LOW_CUTOFF.
+        MASKER_PATH: audio file mixed with the stimulus
+            (looped if shorter); '' for none
+        SNR: stimulus-to-masker ratio in dB
+    """
+    def __init__(self, ramp_ms=0.0, filter_type='None', filter_design='IIR',
+    low_cutoff=250.0, high_cutoff=4000.0, masker_path='', snr=0.0,
+    iir_order=4, fir_taps=511, block_size=2**16):
+        if filter_type not in FILTER_TYPES:
+            raise ValueError(f"Unknown filter type: {filter_type}")
+        if filter_design not in FILTER_DESIGNS:
+            raise ValueError(f"Unknown filter design: {filter_design}")
+        self.ramp_ms = float(ramp_ms)
+        self.filter_type = filter_type
+        self.filter_design = filter_design
+        self.low_cutoff = float(low_cutoff)
+        self.high_cutoff = float(high_cutoff)
+        self.masker_path = masker_path
+        self.snr = float(snr)
+        self.iir_order = iir_order
+        self.fir_taps = fir_taps
+        self.block_size = block_size
+
+
+    @classmethod
+    def from_sessionpars(cls, sessionpars):
+        """ Build a chain from the running sessionpars dict """
+        return cls(
+            ramp_ms=sessionpars['Ramp Duration'].get(),
+            filter_type=sessionpars['Filter Type'].get(),
+            filter_design=sessionpars['Filter Design'].get(),
+            low_cutoff=sessionpars['Low Cutoff'].get(),
+            high_cutoff=sessionpars['High Cutoff'].get(),
+            masker_path=sessionpars['Masker Path'].get(),
+            snr=sessionpars['SNR'].get()
+        )
+
+
+    def is_empty(self):
+        """ True if the chain leaves signals unchanged """
+        return (
+            self.ramp_ms <= 0 and
+            self.filter_type == 'None' and
+            not self.masker_path
+        )
+
+
+    def params(self):
+        """ Hashable description of everything that affects
+            the output (used as part of the memo key).
+        """
+        params = [('ramp_ms', self.ramp_ms)]
+        if self.filter_type != 'None':
+            params += [
+                ('filter', self.filter_type, self.filter_design,
+                self.low_cutoff, self.high_cutoff,
+                self.iir_order, self.fir_taps)
+            ]
+        if self.masker_path:
+            params += [
+                ('masker', audiocache.decode_cache.digest(self.masker_path), self.snr)
+            ]
+        return tuple(params)
+
+
+    def _cutoff(self):
+        """ Cutoff argument for scipy filter design """
+        if self.filter_type == 'Lowpass':
+            return self.high_cutoff, 'lowpass'
+        if self.filter_type == 'Highpass':
+            return self.low_cutoff, 'highpass'
+        return [self.low_cutoff, self.high_cutoff], 'bandpass'
+
+
+    def apply(self, sig, fs):
+        """ Return a processed copy of SIG (frames first) """
+        out = np.array(sig, dtype=np.float64)
+        if self.filter_type != 'None':
+            if self.filter_design == 'IIR':
+                self._filter_iir(out, fs)
+            else:
+                out = self._filter_fir(out, fs)
+        if self.masker_path:
+            self._mix_masker(out, fs)
+        if self.ramp_ms > 0:
+            apply_ramps(out, fs, self.ramp_ms)
+        return out
+
+
+    def _filter_iir(self, sig, fs):
+        """ Butterworth filter, in place, block by block """
+        cutoff, btype = self._cutoff()
+        sos = signal.butter(self.iir_order, cutoff, btype, fs=fs, output='sos')
+        zi = np.zeros((sos.shape[0], 2) + sig.shape[1:])
+        for start in range(0, len(sig), self.block_size):
+            block = sig[start:start+self.block_size]
+            block[:], zi = signal.sosfilt(sos, block, axis=0, zi=zi)
+
+
+    def _filter_fir(self, sig, fs):
+        """ Linear-phase FIR filter by FFT overlap-add. The
+            group delay is removed, so stimuli stay aligned
+            with their unfiltered versions.
+        """
+        cutoff, btype = self._cutoff()
+        taps = self.fir_taps | 1 # odd length for highpass designs
+        h = signal.firwin(taps, cutoff, pass_zero=btype, fs=fs)
+        delay = (taps - 1) // 2
+
+        block_size = self.block_size
+        nfft = 1 << int(np.ceil(np.log2(block_size + taps - 1)))
+        H = np.fft.rfft(h, nfft)
+        if sig.ndim > 1:
+            H = H[:, np.newaxis]
+
+        out = np.zeros_like(sig)
+        n = len(sig)
+        for start in range(0, n, block_size):
+            block = sig[start:start+block_size]
+            seg = np.fft.irfft(np.fft.rfft(block, nfft, axis=0) * H, nfft, axis=0)
+            seg = seg[:len(block) + taps - 1]
+            # Shift back by the group delay and clip to the signal
+            lo = start - delay
+            first = max(0, -lo)
+            last = min(len(seg), n - lo)
+            out[lo+first:lo+last] += seg[first:last]
+        return out
+
+
+    def _mix_masker(self, sig, fs):
+        """ Add the masker, in place, at the target SNR """
+        channels = 1 if sig.ndim == 1 else sig.shape[1]
+        _, masker = load_masker(self.masker_path, fs, channels)
+
+        # Match channel layout (check_masker allows mono or
+        # at least as many channels as the stimulus)
+        if sig.ndim == 1 and masker.ndim > 1:
+            masker = masker[:, 0]
+        elif sig.ndim > 1:
+            if masker.ndim == 1:
+                masker = masker[:, np.newaxis]
+            masker = masker[:, :sig.shape[1]]
+
+        # Stimulus and masker RMS over all channels
+        sig_power = 0.0
+        for start in range(0, len(sig), self.block_size):
+            sig_power += np.square(sig[start:start+self.block_size]).sum()
+        sig_rms = np.sqrt(sig_power / sig.size)
+        masker_rms = np.sqrt(np.mean(np.square(masker)))
+        if masker_rms == 0 or sig_rms == 0:
+            return
+        gain = sig_rms / (masker_rms * 10**(self.snr/20))
+
+        # Loop the masker over the stimulus
+        n_masker = len(masker)
+        for start in range(0, len(sig), n_masker):
+            stop = min(start + n_masker, len(sig))
+            seg = masker[:stop-start]
+            if sig.ndim > 1 and seg.shape[1] == 1:
+                seg = np.broadcast_to(seg, (len(seg), sig.shape[1]))
+            sig[start:stop] += gain * seg
+
+
+def apply_ramps(sig, fs, ramp_ms):
+    """ Apply raised-cosine onset and offset ramps to SIG
+        (frames first), in place.
+    """
+    n = min(int(round(ramp_ms / 1000 * fs)), len(sig) // 2)
+    if n < 1:
+        return sig
+    ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(n) / n)
+    if sig.ndim > 1:
+        ramp = ramp[:, np.newaxis]
+    sig[:n] *= ramp
+    sig[len(sig)-n:] *= ramp[::-1]
+    return sig
+
+
+def load_masker(file_path, fs=None, channels=None):
+    """ Read a masker file as float64 (cached). With the
+        stimulus' FS and CHANNELS, also check that the
+        masker can be mixed into it (see check_masker).
+    """
+    key = audiocache.stat_key(file_path)
+    masker = _maskers.get(key)
+    if masker is None:
+        masker_fs, data = audiocache.read_audio(file_path)
+        masker = (masker_fs, loudness.to_float(data))
+        _maskers.put(key, masker)
+    if fs is not None:
+        check_masker(file_path, masker, fs, channels)
+    return masker
+
+
+def check_masker(file_path, masker, fs, channels):
+    """ Raise ValueError unless MASKER (fs, data) from
+        FILE_PATH can be mixed into a stimulus with FS and
+        CHANNELS: the sampling rates must match, and the
+        masker must be mono (used on every channel) or
+        have at least as many channels (extras are unused).
+    """
+    name = os.path.basename(file_path)
+    masker_fs, data = masker
+    if masker_fs != fs:
+        raise ValueError(
+            f"Masker {name} sampling rate ({masker_fs} Hz) does not "
+            f"match stimulus ({fs} Hz)")
+    masker_channels = 1 if data.ndim == 1 else data.shape[1]
+    if 1 < masker_channels < (channels or 1):
+        raise ValueError(
+            f"Masker {name} has {masker_channels} channels but the "
+            f"stimulus has {channels}: use a mono masker or one with "
+            f"at least {channels} channels")
+
+
+def process(file_path, sig, fs, chain):
+    """
+        Return SIG (the float audio of FILE_PATH) processed
+        by CHAIN. Results are memoized by the file's content
+        digest and the chain parameters; the returned array
+        is read-only and shared between callers.
+    """
+    key = processing_key(file_path, chain)
+    out = _processed.get(key)
+    if out is None:
+        out = chain.apply(sig, fs)
+        out.flags.writeable = False
+        _processed.put(key, out)
+    return out
+
+
+def processing_key(file_path, chain):
+    """ Memo key for a processed file (also used to cache
+        loudness measurements of the processed signal).
+    """
+    return (audiocache.decode_cache.digest(file_path), chain.params())
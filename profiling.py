@@ -0,0 +1,304 @@
+""" Built-in profiling for Rating Sliders.
+
+    Turns on cProfile (main thread) and tracemalloc for a
+    window of trials, started from Diagnostics>Start
+    Profiling or with: python rating_slider.py --profile N
+
+    Each window is written to a session-stamped directory,
+    ~/rating_tool_logs/profiles/<date>/window_NN/:
+        functions.txt   cumulative times: the focus
+                        functions (Audio, setRMS,
+                        save_record, slider callbacks...)
+                        and the top functions overall
+        allocations.txt top allocation sites, overall and
+                        inside the focus functions
+        profile.prof    raw pstats data (e.g., for snakeviz)
+        memory.snapshot raw tracemalloc snapshot
+
+    Two windows (e.g., before and after a change, or
+    early and late in a session) can be compared with
+    Diagnostics>Compare Snapshots... or with:
+        python profiling.py <window dir A> <window dir B>
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import argparse
+import cProfile
+import dis
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+# Import custom modules
+import logs
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = logs.LOG_DIR / 'profiles'
+TRACE_FRAMES = 25 # traceback depth kept by tracemalloc
+TOP = 40 # rows in each report table
+
+# Allocations made by the profiler itself
+_IGNORE = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+def code_key(func):
+    """ pstats key (file, first line, name) of a function """
+    code = func.__code__
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def code_lines(func):
+    """ (file, first line, last line) of a function """
+    code = func.__code__
+    # dis.findlinestarts works on every Python we support
+    # (code.co_lines needs 3.10)
+    last = max(line for _, line in dis.findlinestarts(code) if line is not None)
+    return code.co_filename, code.co_firstlineno, last
+
+
+def default_focus():
+    """ Functions reported by name: {label: function} """
+    import tkinter
+    import models as m
+    import views as v
+    import widgets as w
+    return {
+        'Audio': m.Audio.__init__,
+        'Audio.setRMS': m.Audio.setRMS,
+        'Audio.setLUFS': m.Audio.setLUFS,
+        'Audio.leveled': m.Audio.leveled,
+        'CSVModel.save_record': m.CSVModel.save_record,
+        'CSVModel.save_trajectory': m.CSVModel.save_trajectory,
+        'MainFrame._on_submit': v.MainFrame._on_submit,
+        'MainFrame.reset': v.MainFrame.reset,
+        'CanvasRatingSlider._on_pointer': w.CanvasRatingSlider._on_pointer,
+        'CanvasRatingSlider._flush': w.CanvasRatingSlider._flush,
+        'CanvasRatingSlider._on_variable': w.CanvasRatingSlider._on_variable,
+        'Tk callbacks (all)': tkinter.CallWrapper.__call__,
+    }
+
+
+class SessionProfiler:
+    """ Profiles windows of trials for one session.
+
+        DIRECTORY: report directory (default: a new
+            session-stamped directory in PROFILE_DIR)
+        FOCUS: {label: function} reported by name
+            (default: default_focus())
+    """
+    def __init__(self, directory=None, focus=None):
+        self.directory = Path(directory or
+            PROFILE_DIR / datetime.now().strftime("%Y_%b_%d_%H%M%S"))
+        self.focus = focus if focus is not None else default_focus()
+        self.window = 0
+        self._profile = None
+        self._baseline = None
+        self._n_trials = None
+        self._trials = 0
+        self._started = None
+
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+
+    def start(self, n_trials=None):
+        """ Start a profiling window. With N_TRIALS, it
+            stops by itself after that many trials.
+        """
+        if self.active:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        if hasattr(tracemalloc, 'reset_peak'):
+            # Python 3.9+ (restarting tracing also clears it)
+            tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot().filter_traces(_IGNORE)
+        self._n_trials = n_trials or None
+        self._trials = 0
+        self._started = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logger.info("Profiling started (%s)",
+            f"{n_trials} trials" if n_trials else "until stopped")
+
+
+    def trial_done(self):
+        """ Count a finished trial. Returns the report
+            directory if this ended the window.
+        """
+        if not self.active:
+            return None
+        self._trials += 1
+        if self._n_trials and self._trials >= self._n_trials:
+            return self.stop()
+        return None
+
+
+    def stop(self):
+        """ End the window and write its reports. Returns
+            the window's report directory.
+        """
+        if not self.active:
+            return None
+        self._profile.disable()
+        elapsed = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORE)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profile, self._profile = self._profile, None
+
+        self.window += 1
+        out = self.directory / f"window_{self.window:02d}"
+        out.mkdir(parents=True, exist_ok=True)
+        header = (f"Window {self.window}: {self._trials} trials, "
+            f"{elapsed:.1f} s, peak traced memory {peak / 2**20:.1f} MiB\n")
+
+        profile.dump_stats(out / 'profile.prof')
+        snapshot.dump(out / 'memory.snapshot')
+        with open(out / 'functions.txt', 'w') as fh:
+            fh.write(header + '\n')
+            fh.write(format_functions(pstats.Stats(profile), self.focus))
+        with open(out / 'allocations.txt', 'w') as fh:
+            fh.write(header + '\n')
+            fh.write(format_allocations(snapshot, self._baseline, self.focus))
+        self._baseline = None
+        logger.info("Profiling stopped: %s", out)
+        return out
+
+
+def format_functions(stats, focus):
+    """ Focus function table plus the top functions by
+        cumulative time
+    """
+    lines = ["Focus functions:",
+        f"  {'function':<34}{'calls':>8}{'own s':>10}{'cum s':>10}{'ms/call':>10}"]
+    for label, func in focus.items():
+        row = stats.stats.get(code_key(func))
+        if row is None:
+            lines.append(f"  {label:<34}{0:>8}")
+            continue
+        _, ncalls, tottime, cumtime, _ = row
+        lines.append(f"  {label:<34}{ncalls:>8}{tottime:>10.3f}{cumtime:>10.3f}"
+            f"{cumtime / ncalls * 1000:>10.2f}")
+
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats('cumulative').print_stats(TOP)
+    lines += ["", "Top functions by cumulative time:", buf.getvalue()]
+    return '\n'.join(lines)
+
+
+def format_allocations(snapshot, baseline, focus):
+    """ Top allocation sites: live at the end of the
+        window, grown during the window, and allocated
+        (at any depth) inside each focus function
+    """
+    lines = ["Top allocation sites (live at end of window):"]
+    for stat in snapshot.statistics('lineno')[:TOP]:
+        lines.append(f"  {stat}")
+
+    if baseline is not None:
+        lines += ["", "Growth during window:"]
+        for stat in snapshot.compare_to(baseline, 'lineno')[:TOP]:
+            if stat.size_diff:
+                lines.append(f"  {stat}")
+
+    # Attribute each traceback to the focus functions on it
+    ranges = {label: code_lines(func) for label, func in focus.items()}
+    totals = {label: [0, 0] for label in focus}
+    for stat in snapshot.statistics('traceback'):
+        for label, (filename, first, last) in ranges.items():
+            if any(frame.filename == filename and first <= frame.lineno <= last
+                    for frame in stat.traceback):
+                totals[label][0] += stat.size
+                totals[label][1] += stat.count
+    lines += ["", "Live memory allocated inside focus functions:"]
+    for label, (size, count) in totals.items():
+        lines.append(f"  {label:<34}{size / 1024:>12.1f} KiB{count:>10} blocks")
+    return '\n'.join(lines) + '\n'
+
+
+def _window_files(path, name):
+    """ PATH itself, or NAME inside a window directory """
+    path = Path(path)
+    return path / name if path.is_dir() else path
+
+
+def diff_windows(a, b, top=TOP):
+    """ Compare two profiling windows (directories written
+        by SessionProfiler.stop, or their profile.prof /
+        memory.snapshot files). Returns a text report of
+        B relative to A.
+    """
+    lines = [f"A: {a}", f"B: {b}", ""]
+
+    prof_a = _window_files(a, 'profile.prof')
+    prof_b = _window_files(b, 'profile.prof')
+    if prof_a.suffix == '.prof' and prof_a.exists() and prof_b.exists():
+        stats_a = pstats.Stats(str(prof_a)).stats
+        stats_b = pstats.Stats(str(prof_b)).stats
+        rows = []
+        for key in set(stats_a) | set(stats_b):
+            calls_a, cum_a = _calls_cum(stats_a.get(key))
+            calls_b, cum_b = _calls_cum(stats_b.get(key))
+            rows.append((cum_b - cum_a, key, calls_a, cum_a, calls_b, cum_b))
+        rows.sort(key=lambda row: abs(row[0]), reverse=True)
+        lines += ["Cumulative time, largest changes:",
+            f"  {'delta s':>9}{'A s':>9}{'B s':>9}{'A calls':>9}{'B calls':>9}  function"]
+        for delta, key, calls_a, cum_a, calls_b, cum_b in rows[:top]:
+            lines.append(f"  {delta:>+9.3f}{cum_a:>9.3f}{cum_b:>9.3f}"
+                f"{calls_a:>9}{calls_b:>9}  {pstats.func_std_string(key)}")
+        lines.append("")
+
+    snap_a = _window_files(a, 'memory.snapshot')
+    snap_b = _window_files(b, 'memory.snapshot')
+    if snap_a.suffix == '.snapshot' and snap_a.exists() and snap_b.exists():
+        lines.append("Allocation sites, largest changes:")
+        stats = tracemalloc.Snapshot.load(str(snap_b)).compare_to(
+            tracemalloc.Snapshot.load(str(snap_a)), 'lineno')
+        for stat in stats[:top]:
+            lines.append(f"  {stat}")
+    return '\n'.join(lines) + '\n'
+
+
+def _calls_cum(row):
+    """ (calls, cumulative time) from a pstats row """
+    if row is None:
+        return 0, 0.0
+    return row[1], row[3]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two Rating Sliders profiling windows")
+    parser.add_argument('a', help="earlier window directory (or file)")
+    parser.add_argument('b', help="later window directory (or file)")
+    parser.add_argument('--top', type=int, default=TOP)
+    parser.add_argument('-o', '--output', help="write the report to a file")
+    args = parser.parse_args()
+
+    report = diff_windows(args.a, args.b, args.top)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+""" Stimulus quality control for Rating Sliders.
+
+    Scans an audio files directory in a process pool and
+    reports, for each file: peak level and headroom at the
+    presentation level (i.e., whether leveling will make it
+    clip), DC offset, leading/trailing silence, sampling
+    rate, data type or channel counts that differ from the
+    rest of the set, and whether the session masker (if
+    any) can be mixed into it.
+
+    Can be run from File>Session ("Check Files...") or
+    from the command line:
+        python qc.py <audio dir> --level -50 --json qc.json
+            [--masker noise.wav]
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import argparse
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# Import science packages
+import numpy as np
+
+# Import custom modules
+import audiocache
+import loudness
+import processing
+
+
+# Thresholds for reported issues
+MIN_HEADROOM = 0.0 # dB below full scale after leveling
+MAX_DC = 0.01 # DC offset, as a fraction of full scale
+SILENCE_THRESHOLD = -60.0 # dBFS; quieter samples count as silence
+MAX_SILENCE = 0.5 # seconds of leading or trailing silence
+
+
+def check_file(file_path, level=-50.0, level_ref='RMS', block_size=2**16):
+    """ Measure one file in a single block-wise pass.
+        Returns a dictionary of measurements (or an
+        'error' entry if the file can't be read).
+    """
+    result = {'file': os.path.basename(file_path)}
+    try:
+        fs, data = audiocache.read_audio(file_path, mmap=True)
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+    channels = 1 if data.ndim == 1 else data.shape[1]
+    result.update({'fs': fs, 'dtype': str(data.dtype),
+        'channels': channels, 'dur': len(data) / fs})
+
+    meter = loudness.LoudnessMeter(fs, channels)
+    threshold = 10**(SILENCE_THRESHOLD/20)
+    dc = np.zeros(channels)
+    first_sound = None
+    last_sound = None
+    for start in range(0, len(data), block_size):
+        block = loudness.to_float(data[start:start+block_size])
+        meter.process(block)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        dc += block.sum(axis=0)
+        loud = np.flatnonzero((np.abs(block) > threshold).any(axis=1))
+        if len(loud):
+            if first_sound is None:
+                first_sound = start + loud[0]
+            last_sound = start + loud[-1]
+    del data
+
+    stats = meter.results()
+    n = max(stats['frames'], 1)
+    rms_db = stats['rms_db']
+
+    # Gain that leveling will apply to each channel (see
+    # Audio.leveled). setLUFS applies one gain to every
+    # channel. setRMS levels each of the first two channels
+    # to the target on its own, so a stereo file with a
+    # quiet but peaky channel can clip on that channel only.
+    peaks = np.array(stats['peak_db'], dtype=float)
+    if level_ref == 'LUFS':
+        ref_db = np.full(channels, stats['integrated_lufs'])
+    else:
+        # Only the first two channels are played
+        peaks = peaks[:2]
+        ref_db = np.array(rms_db[:2], dtype=float)
+    gains = np.where(np.isfinite(ref_db), level - ref_db, 0.0)
+    headrooms = -(peaks + gains)
+    worst = int(np.argmin(headrooms))
+
+    if first_sound is None:
+        lead = trail = stats['frames'] / fs
+    else:
+        lead = first_sound / fs
+        trail = (stats['frames'] - 1 - last_sound) / fs
+
+    result.update({
+        'rms_db': rms_db,
+        'lufs': stats['integrated_lufs'],
+        'peak_db': float(peaks[worst]),
+        'gain_db': gains.tolist(),
+        'headroom_db': float(headrooms[worst]),
+        'worst_channel': worst,
+        'dc_offset': (dc / n).tolist(),
+        'leading_silence': lead,
+        'trailing_silence': trail
+    })
+    return result
+
+
+def _check_args(args):
+    """ Unpack arguments for ProcessPoolExecutor.map """
+    return check_file(*args)
+
+
+def find_issues(results, masker_path='', masker=None):
+    """ Add an 'issues' list to each result, including
+        properties that differ from the majority of files
+        and, with MASKER (fs, data) from MASKER_PATH, files
+        it can't be mixed into.
+    """
+    readable = [r for r in results if 'error' not in r]
+    majority = {}
+    for key in ('fs', 'dtype', 'channels'):
+        counts = Counter(r[key] for r in readable)
+        if counts:
+            majority[key] = counts.most_common(1)[0][0]
+
+    for r in results:
+        issues = []
+        if 'error' in r:
+            issues.append('unreadable')
+        else:
+            if r['headroom_db'] < MIN_HEADROOM:
+                issues.append('clips at level')
+            if max(abs(x) for x in r['dc_offset']) > MAX_DC:
+                issues.append('DC offset')
+            if r['leading_silence'] > MAX_SILENCE:
+                issues.append('leading silence')
+            if r['trailing_silence'] > MAX_SILENCE:
+                issues.append('trailing silence')
+            for key, value in majority.items():
+                if r[key] != value:
+                    issues.append(f'{key} mismatch')
+            if masker is not None:
+                try:
+                    processing.check_masker(masker_path, masker, r['fs'], 
+                        r['channels'])
+                except ValueError:
+                    issues.append('masker mismatch')
+        r['issues'] = issues
+    return majority
+
+
+def scan_directory(directory, level=-50.0, level_ref='RMS', workers=None,
+masker_path=''):
+    """ Check every audio file in DIRECTORY in parallel
+        (and against the masker at MASKER_PATH, if given).
+        Returns a report dictionary (see to_json and
+        format_table).
+    """
+    files = sorted(f for f in os.listdir(directory)
+        if audiocache.is_audio_file(f))
+    args = [(os.path.join(directory, f), level, level_ref) for f in files]
+
+    if args:
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(args) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_check_args, args, chunksize=chunksize))
+    else:
+        results = []
+
+    masker = None
+    masker_error = None
+    if masker_path:
+        try:
+            masker = processing.load_masker(masker_path)
+        except Exception as e:
+            masker_error = str(e)
+
+    majority = find_issues(results, masker_path, masker)
+    report = {
+        'directory': directory,
+        'level': level,
+        'level_ref': level_ref,
+        'masker': masker_path,
+        'majority': majority,
+        'files': results
+    }
+    if masker is not None:
+        report['masker_fs'] = masker[0]
+        report['masker_channels'] = 1 if masker[1].ndim == 1 else masker[1].shape[1]
+    if masker_error:
+        report['masker_error'] = masker_error
+    return report
+
+
+def _finite(obj):
+    """ Copy of OBJ with numpy numbers converted and
+        non-finite floats replaced by None
+    """
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, (float, np.floating)):
+        obj = float(obj)
+        return obj if np.isfinite(obj) else None
+    return obj
+
+
+def to_json(report, file_path=None):
+    """ Return the report as JSON (and write it to
+        FILE_PATH if given).
+    """
+    # Silent files have infinite levels; JSON has no
+    # Infinity, so they are written as null
+    text = json.dumps(_finite(report), indent=2, allow_nan=False)
+    if file_path:
+        with open(file_path, 'w') as fh:
+            fh.write(text)
+    return text
+
+
+def format_table(report, problems_only=False):
+    """ Return the report as a fixed-width text table """
+    header = (f"{'File':<40} {'fs':>6} {'ch':>3} {'dtype':>8} "
+        f"{'Peak':>7} {'Headroom':>9} {'Lead':>6} {'Trail':>6}  Issues")
+    lines = [
+        f"Directory: {report['directory']}",
+        f"Level: {report['level']} ({report['level_ref']})",
+    ]
+    if report.get('masker_error'):
+        lines.append(f"Masker: {report['masker']} (unreadable: "
+            f"{report['masker_error']})")
+    elif report.get('masker'):
+        lines.append(f"Masker: {report['masker']} ({report['masker_fs']} Hz, "
+            f"{report['masker_channels']} ch)")
+    lines += [
+        "",
+        header,
+        "-" * len(header)
+    ]
+    n_problems = 0
+    for r in report['files']:
+        if r['issues']:
+            n_problems += 1
+        elif problems_only:
+            continue
+        if 'error' in r:
+            lines.append(f"{r['file'][:40]:<40} {r['error']}")
+            continue
+        lines.append(
+            f"{r['file'][:40]:<40} {r['fs']:>6} {r['channels']:>3} "
+            f"{r['dtype']:>8} {r['peak_db']:>7.1f} {r['headroom_db']:>9.1f} "
+            f"{r['leading_silence']:>6.2f} {r['trailing_silence']:>6.2f}  "
+            f"{', '.join(r['issues'])}"
+        )
+    lines += ["", f"{len(report['files'])} files, {n_problems} with issues"]
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check stimulus files")
+    parser.add_argument('directory')
+    parser.add_argument('--level', type=float, default=-50.0,
+        help="presentation level (dB)")
+    parser.add_argument('--ref', default='RMS', choices=['RMS', 'LUFS'],
+        help="leveling reference")
+    parser.add_argument('--masker', default='',
+        help="check that this masker can be mixed into every file")
+    parser.add_argument('--json', help="write the report to this file")
+    parser.add_argument('--workers', type=int, help="number of processes")
+    parser.add_argument('--problems', action='store_true',
+        help="only list files with issues")
+    args = parser.parse_args()
+
+    report = scan_directory(args.directory, args.level, args.ref, args.workers,
+        args.masker)
+    if args.json:
+        to_json(report, args.json)
+    print(format_table(report, problems_only=args.problems))
+
+
+if __name__ == "__main__":
+    main()
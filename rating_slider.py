@@ -15,8 +15,15 @@ import tkinter as tk
 from tkinter import ttk
 
 # Import system packages
+import argparse
+import logging
 import os
+import time
+import multiprocessing
+import threading
+from tkinter import filedialog
 from tkinter import messagebox
+from tkinter import simpledialog
 
 # Import data science packages
 import random
@@ -24,13 +31,30 @@ import random
 # Import custom modules
 import views as v
 import models as m
+import logs
+import processing
+import profiling
+import server
+import watchdog
 from mainmenu import MainMenu
 
 
+# Named explicitly: this module usually runs as __main__
+logger = logging.getLogger('rating_slider')
+
+
 class Application(tk.Tk):
-    """ Application root window """
-    def __init__(self, *args, **kwargs):
+    """ Application root window. With SERVER=(host, port),
+        trials come from (and ratings go to) a rating 
+        server instead of the local audio files directory.
+        With PROFILE=N, the first N trials are profiled
+        (0: the whole session; see profiling.py).
+    """
+    def __init__(self, *args, server=None, profile=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self._server = server
+        self._client = None
+        self._trial = None
 
         self.withdraw()
         self.title("Rating Sliders")
@@ -38,6 +62,16 @@ class Application(tk.Tk):
         # Not really using this here
         self.settings_model = m.SettingsModel()
         self._load_settings()
+        logs.setup_logging(self.settings['log levels'].get())
+        # Correlation ID of the trial in progress
+        self._trial_id = None
+        self._trial_start = time.perf_counter()
+        # Stimulus onset of the trial in progress
+        self._onset = None
+        # Report UI stalls (e.g., during play or save)
+        self.watchdog = watchdog.StallWatchdog(self, 
+            threshold_ms=self.settings['stall threshold ms'].get())
+        self.watchdog.start()
 
         # Load current session parameters (or defaults)
         self.sessionpars_model = m.SessionParsModel()
@@ -45,15 +79,24 @@ class Application(tk.Tk):
 
         # Make audio files list model
         self._audio_list = []
-        self.audiolist_model = m.AudioList(self.sessionpars)
-        self._load_audiolist_model()
+        self._player = None
+        if self._server is None:
+            self._load_audiolist_model()
 
         # NOTE: can't show sessionpars dialog yet because
         # there's no parent to pass the event to!
 
         # Initialize objects
         self.model = m.CSVModel(self.sessionpars)
-        self.main_frame = v.MainFrame(self, self.model, self.settings, self.sessionpars)
+        self.scales_model = m.ScalesModel()
+        # Running results for the experimenter dashboard
+        self.summary = m.RatingSummary(
+            [scale['name'] for scale in self.scales_model.fields['Scales']['value']])
+        self._dashboard = None
+        self.main_frame = v.MainFrame(self, self.model, self.settings, 
+            self.sessionpars, 
+            scales=self.scales_model.fields['Scales']['value'],
+            columns=self.scales_model.fields['Columns']['value'])
         self.main_frame.grid(row=1, column=0)
         self.main_frame.bind('<<SaveRecord>>', self._on_submit)
         self.main_frame.bind('<<PlayAudio>>', self._on_play)
@@ -64,13 +107,20 @@ class Application(tk.Tk):
         # Create callback dictionary
         event_callbacks = {
             '<<FileSession>>': lambda _: self._show_sessionpars(),
-            '<<FileQuit>>': lambda _: self.quit(),
+            '<<FilePreview>>': lambda _: v.PreviewWindow(self, self.sessionpars),
+            '<<FileDashboard>>': lambda _: self._show_dashboard(),
+            '<<FileQuit>>': lambda _: self._quit(),
+            '<<DiagnosticsProfileStart>>': lambda _: self._start_profiling(),
+            '<<DiagnosticsProfileStop>>': lambda _: self._stop_profiling(),
+            '<<DiagnosticsCompare>>': lambda _: self._compare_profiles(),
             '<<ParsDialogOk>>': lambda _: self._save_sessionpars(),
             '<<ParsDialogCancel>>': lambda _: self._load_sessionpars()
         }
         # Bind callbacks to sequences
         for sequence, callback in event_callbacks.items():
             self.bind(sequence, callback)
+        # Closing the window also ends the session cleanly
+        self.protocol("WM_DELETE_WINDOW", self._quit)
 
         # Status label to display trial count
         self.status = tk.StringVar(value="Trials Completed: 0")
@@ -78,6 +128,11 @@ class Application(tk.Tk):
         # Track trial number
         self._records_saved = 0
 
+        # cProfile/tracemalloc windows (Diagnostics menu)
+        self.profiler = profiling.SessionProfiler()
+        if profile is not None:
+            self.profiler.start(profile)
+
         # # Set up root window
         self.deiconify()
 
@@ -97,10 +152,18 @@ class Application(tk.Tk):
 
     def _show_sessionpars(self):
         """ Show the session parameters dialog """
-        print("App_83: Calling sessionpars dialog...")
+        logger.debug("Calling sessionpars dialog...")
         v.SessionParams(self, sessionpars=self.sessionpars, title="Parameters", error='')
 
 
+    def _show_dashboard(self):
+        """ Show (or raise) the experimenter dashboard """
+        if self._dashboard is not None and self._dashboard.winfo_exists():
+            self._dashboard.lift()
+            return
+        self._dashboard = v.Dashboard(self, self.summary, len(self._audio_list))
+
+
     def _load_sessionpars(self):
         """Load parameters into self.sessionpars dict."""
         #print("App:89: Creating running dict from sessionpars model fields...")
@@ -116,7 +179,7 @@ class Application(tk.Tk):
         for key, data in self.sessionpars_model.fields.items():
             vartype = vartypes.get(data['type'], tk.StringVar)
             self.sessionpars[key] = vartype(value=data['value'])
-        print("App:119: Loaded sessionpars model fields into running sessionpars dict")
+        logger.debug("Loaded sessionpars model fields into running sessionpars dict")
 
         # Put a trace on the variables so they get stored when changed.
         #for var in self.sessionpars.values():
@@ -125,57 +188,152 @@ class Application(tk.Tk):
 
     def _save_sessionpars(self, *_):
         """ Save the current settings to a preferences file """
-        print("App_111: Calling sessionpar model set vars and save functions")
+        logger.debug("Calling sessionpar model set vars and save functions")
         for key, variable in self.sessionpars.items():
             self.sessionpars_model.set(key, variable.get())
             self.sessionpars_model.save()
 
 
     def _load_audiolist_model(self):
-        self.audiolist_model = m.AudioList(self.sessionpars)
-        print(f"App_136: Audio files path: {self.sessionpars['Audio Files Path'].get()}")
-        self._audio_list = self.audiolist_model.fields['Audio List']
+        try:
+            self.audiolist_model = m.AudioList(self.sessionpars)
+        except ValueError as e:
+            # Missing or unreadable trial list file
+            logger.error("%s", e)
+            self._audio_list = []
+            messagebox.showerror(
+                title="Trial list",
+                message="Could not read the trial list file. "
+                "Please check it in File>Session.",
+                detail=str(e)
+            )
+            return
+        logger.info("Audio files path: %s", self.sessionpars['Audio Files Path'].get())
+        # Each entry is a trial: a tuple of one or more files
+        self._audio_list = self.audiolist_model.fields['Trial List']
         if len(self._audio_list) > 0:
-            print("App:139: Loaded randomized audio files from AudioList model into running list")
+            logger.debug("Loaded randomized audio files from AudioList model into running list")
+            self._warn_unused_files()
         else:
-            print("App_141: No audio files in list!")
+            logger.warning("No audio files in list!")
             messagebox.showwarning(
                 title="No path selected",
                 message="Please use File>Session to selected a valid audio file directory!"
             )
 
 
+    def _warn_unused_files(self):
+        """ Tell the experimenter about files that were
+            left out of the trial list
+        """
+        unused = self.audiolist_model.fields['Unused Files']
+        skipped = self.audiolist_model.fields['Skipped Trials']
+        if not unused and not skipped:
+            return
+        detail = []
+        if unused:
+            detail.append(f"{len(unused)} file(s) not in any trial:\n" 
+                + '\n'.join(unused[:10]) + ('\n...' if len(unused) > 10 else ''))
+        if skipped:
+            detail.append(f"{len(skipped)} trial list row(s) skipped:\n"
+                + '\n'.join(f"{', '.join(row)} ({reason})" 
+                    for row, reason in skipped[:10])
+                + ('\n...' if len(skipped) > 10 else ''))
+        messagebox.showwarning(
+            title="Files left out",
+            message="Some stimuli will not be presented.",
+            detail='\n\n'.join(detail)
+        )
+
+
     def _on_submit(self, *_):
         """ Save trial ratings, update trial counter,
             and reset sliders.
          """
+        if self._server is not None:
+            self._submit_to_server()
+            return
+
         # Get _vars from main_frame view
         data = self.main_frame.get()
         # Update _vars with current audio file name
-        data["Audio Filename"] = self._audio_list[self._records_saved]
+        trial = self._audio_list[self._records_saved]
+        data["Audio Filename"] = trial[0]
+        for idx, filename in enumerate(trial[1:], start=2):
+            data[f"Audio Filename {idx}"] = filename
+        # Link the row to its slider trajectory and log records
+        data["Trajectory"] = f"trial_{self._records_saved + 1:04d}"
+        data["Trial ID"] = logs.get_trial_id()
+        data["Onset Delay"] = self._onset_delay()
         # Pass data dict to CSVModel for saving
         self.model.save_record(data)
+        self.model.save_trajectory(data["Trajectory"], 
+            self.main_frame.trajectory.get())
         self._records_saved += 1
+        self._end_trial()
         self.status.set(f"Trials Completed: {self._records_saved}")
+        # Update running results
+        stim = self.summary.add(' / '.join(trial), data)
+        if self._dashboard is not None and self._dashboard.winfo_exists():
+            self._dashboard.update_plot(stim)
         self.main_frame.reset()
 
 
     def _on_play(self, *_):
         """ Get next .wav file name and present audio """
+        self._begin_trial()
+        if self._server is not None:
+            self._play_from_server()
+            return
+
         # If empty files list, try loading again
         if len(self._audio_list) == 0:
-            print("App_163: Empty list - attempting to load audio files from directory")
+            logger.info("Empty list - attempting to load audio files from directory")
             self._load_audiolist_model()
 
         if len(self._audio_list) > 0:
             # Check index of next file with list
             if self._records_saved < len(self._audio_list):
-                file_path = self.sessionpars['Audio Files Path'].get() + os.sep + self._audio_list[self._records_saved]
-                # Update CSVModel with audio file name
+                trial = self._audio_list[self._records_saved]
+                chain = processing.ProcessingChain.from_sessionpars(self.sessionpars)
 
                 # Audio object expects a full file path and a presentation level
-                audio_obj = m.Audio(file_path, self.sessionpars['Presentation Level'].get())
-                audio_obj.play()
+                audio_objs = []
+                try:
+                    for filename in trial:
+                        file_path = self.sessionpars['Audio Files Path'].get() + os.sep + filename
+                        audio_objs.append(m.Audio(file_path, 
+                            self.sessionpars['Presentation Level'].get(),
+                            self.sessionpars['Level Reference'].get(),
+                            chain))
+                except ValueError as e:
+                    # E.g., a masker that doesn't fit the stimulus
+                    logger.error("Could not prepare trial: %s", e)
+                    messagebox.showerror(title="Cannot play trial", 
+                        message=str(e))
+                    return
+
+                self._stop_player()
+                logger.info("Playing trial %d: %s", self._records_saved + 1, 
+                    ', '.join(trial))
+                self._stimulus_onset()
+                if len(audio_objs) == 1:
+                    audio_objs[0].play()
+                else:
+                    # Multi-stimulus trial: one gapless stream
+                    if len({a.fs for a in audio_objs}) > 1:
+                        messagebox.showerror(
+                            title="Sampling rate mismatch",
+                            message="All stimuli in a trial must share "
+                            "the same sampling rate!"
+                        )
+                        return
+                    self._player = m.SequencePlayer(
+                        [a.leveled() for a in audio_objs],
+                        audio_objs[0].fs,
+                        self.sessionpars['ISI'].get() / 1000
+                    )
+                    self._player.play()
                 # Enable submit button on successful presentation
                 self.main_frame.btn_submit.config(state="enabled")
             elif self._records_saved >= len(self._audio_list):
@@ -187,8 +345,229 @@ class Application(tk.Tk):
                 self._quit()
 
 
+    def _play_from_server(self):
+        """ Fetch the current trial from the rating server
+            (once per trial) and present it
+        """
+        if self._trial is not None:
+            # Repeated play: the audio is already here
+            self._present_server_trial()
+            return
+
+        subject = self.sessionpars['Subject'].get()
+        condition = self.sessionpars['Condition'].get()
+        def fetch():
+            if self._client is None:
+                client = server.RatingClient(*self._server)
+                try:
+                    client.start(subject, condition)
+                except Exception:
+                    client.close()
+                    raise
+                self._client = client
+            return self._client.next_trial()
+        self._server_request(fetch, self._on_server_trial)
+
+
+    def _on_server_trial(self, trial):
+        """ Present a trial fetched by _play_from_server """
+        self._trial = trial
+        if self._trial is None:
+            messagebox.showinfo(
+                title="Done!",
+                message="You have finished this task!\n"
+                "Please let the experimenter know."
+            )
+            self._quit()
+            return
+        self._present_server_trial()
+
+
+    def _present_server_trial(self):
+        """ Play the current server trial """
+        self._stop_player()
+        logger.info("Playing trial %d: %s", self._trial['trial'], 
+            ', '.join(self._trial['files']))
+        self._player = m.SequencePlayer(self._trial['buffers'], 
+            self._trial['fs'], self._trial['isi'])
+        self._stimulus_onset()
+        self._player.play()
+        self.main_frame.btn_submit.config(state="enabled")
+
+
+    def _submit_to_server(self):
+        """ Send the current trial's ratings to the server """
+        data = self.main_frame.get()
+        ratings = {name: data[name] for name in self.summary.names}
+        payload = {**ratings, "Onset Delay": self._onset_delay()}
+        trajectory = self.main_frame.trajectory.get()
+        self._server_request(
+            lambda: self._client.submit(payload, trajectory),
+            lambda _: self._on_server_saved(ratings))
+
+
+    def _on_server_saved(self, ratings):
+        """ Update the session once the server has stored
+            the current trial
+        """
+        self._records_saved += 1
+        self._end_trial()
+        self.status.set(f"Trials Completed: {self._records_saved}")
+        stim = self.summary.add(' / '.join(self._trial['files']), ratings)
+        if self._dashboard is not None and self._dashboard.winfo_exists():
+            self._dashboard.update_plot(stim)
+        self._trial = None
+        self.main_frame.reset()
+
+
+    def _server_request(self, request, on_done):
+        """ Run REQUEST (blocking RatingClient calls) in a
+            worker thread, so the UI stays responsive, then
+            call ON_DONE with its result. Play and Submit
+            are disabled until it finishes.
+        """
+        submit_state = str(self.main_frame.btn_submit.cget('state'))
+        self.main_frame.btn_play.config(state="disabled")
+        self.main_frame.btn_submit.config(state="disabled")
+        self.status.set("Waiting for server...")
+        result = {}
+        def run():
+            try:
+                result['value'] = request()
+            except Exception as e:
+                # Anything the request raises (including bad
+                # replies) goes to the error path in
+                # _poll_server; otherwise the buttons would
+                # stay disabled
+                result['error'] = e
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._poll_server(thread, result, on_done, submit_state)
+
+
+    def _poll_server(self, thread, result, on_done, submit_state):
+        """ Wait for a server request without blocking the UI """
+        if thread.is_alive():
+            self.after(50, self._poll_server, thread, result, on_done, 
+                submit_state)
+            return
+        self.main_frame.btn_play.config(state="normal")
+        self.status.set(f"Trials Completed: {self._records_saved}")
+        if 'error' in result:
+            self.main_frame.btn_submit.config(state=submit_state)
+            logger.error("Server request failed: %r", result['error'])
+            messagebox.showerror(title="Server error", 
+                message=str(result['error']) or repr(result['error']))
+            return
+        on_done(result['value'])
+
+
+    def _begin_trial(self):
+        """ Give the trial in progress a correlation ID for
+            log records (kept across repeated plays)
+        """
+        if self._trial_id is None:
+            self._trial_id = logs.new_trial_id()
+            self._trial_start = time.perf_counter()
+            logs.set_trial_id(self._trial_id)
+
+
+    def _stimulus_onset(self):
+        """ Start the slider trajectory clock at the first
+            presentation of the trial
+        """
+        if self._onset is None:
+            self._onset = time.perf_counter()
+            self.main_frame.start_trial()
+
+
+    def _onset_delay(self):
+        """ Seconds from the rating screen being ready to
+            the first stimulus onset
+        """
+        if self._onset is None:
+            return ''
+        return round(self._onset - self.main_frame.ready_time, 3)
+
+
+    def _end_trial(self):
+        """ Log the saved trial and clear its ID """
+        logger.info("Saved trial %d (%.0f ms after first play)", 
+            self._records_saved, 
+            (time.perf_counter() - self._trial_start) * 1000)
+        self._trial_id = None
+        self._onset = None
+        logs.set_trial_id(None)
+        # Log only: a dialog would interrupt the subject
+        self.profiler.trial_done()
+
+
+    def _start_profiling(self):
+        """ Profile the next N trials (0: until stopped) """
+        if self.profiler.active:
+            messagebox.showinfo(title="Profiling", 
+                message="Profiling is already running.")
+            return
+        n_trials = simpledialog.askinteger("Start Profiling",
+            "Number of trials to profile (0: until stopped):",
+            parent=self, initialvalue=10, minvalue=0)
+        if n_trials is not None:
+            self.profiler.start(n_trials)
+
+
+    def _stop_profiling(self):
+        """ End the profiling window and write its reports """
+        out = self.profiler.stop()
+        if out is None:
+            messagebox.showinfo(title="Profiling", 
+                message="Profiling is not running.")
+            return
+        messagebox.showinfo(title="Profiling", 
+            message="Profiling reports written to:", detail=str(out))
+
+
+    def _compare_profiles(self):
+        """ Show the difference between two profiling
+            windows
+        """
+        initial = str(self.profiler.directory if self.profiler.directory.exists()
+            else profiling.PROFILE_DIR)
+        first = filedialog.askdirectory(parent=self, initialdir=initial,
+            title="Earlier profiling window")
+        if not first:
+            return
+        second = filedialog.askdirectory(parent=self, initialdir=first,
+            title="Later profiling window")
+        if not second:
+            return
+        try:
+            report = profiling.diff_windows(first, second)
+        except (OSError, ValueError, EOFError) as e:
+            messagebox.showerror(title="Compare Snapshots", message=str(e))
+            return
+        v.TextReport(self, "Profile Comparison", report)
+
+
+    def report_callback_exception(self, exc, val, tb):
+        """ Log errors raised in Tk callbacks """
+        logger.error("Unhandled error in callback", exc_info=(exc, val, tb))
+        super().report_callback_exception(exc, val, tb)
+
+
+    def _stop_player(self):
+        """ Stop any multi-stimulus trial still playing """
+        if self._player is not None:
+            self._player.stop()
+            self._player = None
+
+
     def _quit(self):
         """ Exit the program """
+        if self._client is not None:
+            # Don't hang the window on an unresponsive server
+            self._client.close(timeout=1)
+        self.watchdog.stop()
+        self.profiler.stop()
         self.destroy()
 
 
@@ -225,5 +604,18 @@ class Application(tk.Tk):
 
 
 if __name__ == "__main__":
-    app = Application()
+    # Needed for the QC process pool in frozen builds
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Rating Sliders")
+    parser.add_argument('--server', metavar='HOST:PORT',
+        help="get trials from a rating server (see server.py)")
+    parser.add_argument('--profile', metavar='N', type=int, nargs='?', const=0,
+        help="profile the first N trials (no N: the whole session)")
+    args = parser.parse_args()
+    if args.server:
+        host, _, port = args.server.rpartition(':')
+        app = Application(server=(host or server.DEFAULT_HOST, int(port)),
+            profile=args.profile)
+    else:
+        app = Application(profile=args.profile)
     app.mainloop()
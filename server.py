@@ -0,0 +1,425 @@
+""" Local multi-booth server for Rating Sliders.
+
+    One server process owns the stimulus index, a shared
+    cache of decoded and leveled stimuli, and the result
+    files. Booths run thin clients (the normal Tk app with
+    --server, or the headless client below) that fetch
+    their next trial and submit ratings over a local socket.
+
+    Protocol: each message is one line of JSON. A reply to
+    'next' is followed by 'nbytes' bytes of float32 audio
+    (the trial's leveled stimuli, frames first, one after
+    the other).
+
+        {"op": "start", "subject": ..., "condition": ...}
+        {"op": "next"}
+        {"op": "submit", "ratings": {...}, "trajectory": {...}}
+        {"op": "bye"}
+
+    Usage:
+        python server.py serve --port 8765
+        python server.py client --port 8765 --sessions 24
+
+    Settings (audio path, level, etc.) come from the saved
+    session parameters file, as in the desktop app.
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+
+# Import science packages
+import numpy as np
+
+# Import custom modules
+import audiocache
+import logs
+import models as m
+import processing
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+logger = logging.getLogger(__name__)
+
+
+class StaticVar:
+    """ Read-only stand-in for a tk variable, so models
+        written for the Tk app (AudioList, CSVModel) can
+        be used without a Tk root.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def load_sessionpars(**overrides):
+    """ Saved session parameters as a StaticVar dict """
+    fields = m.SessionParsModel().fields
+    pars = {key: StaticVar(data['value']) for key, data in fields.items()}
+    for key, value in overrides.items():
+        pars[key] = StaticVar(value)
+    return pars
+
+
+class Session:
+    """ One booth's session on the server """
+    def __init__(self, server, subject, condition):
+        self.id = uuid.uuid4().hex[:8]
+        self.sessionpars = dict(server.sessionpars)
+        self.sessionpars['Subject'] = StaticVar(subject)
+        self.sessionpars['Condition'] = StaticVar(condition)
+        self.model = m.CSVModel(self.sessionpars)
+
+        # Each session gets its own random order
+        self.trials = list(server.trials)
+        random.shuffle(self.trials)
+        self.records_saved = 0
+
+
+class RatingServer:
+    """ asyncio server shared by many booth sessions.
+
+        SESSIONPARS: StaticVar dict (see load_sessionpars)
+    """
+    def __init__(self, sessionpars, host=DEFAULT_HOST, port=DEFAULT_PORT,
+    cache_size=64):
+        self.sessionpars = sessionpars
+        self.host = host
+        self.port = port
+        self.trials = list(m.AudioList(sessionpars).fields['Trial List'])
+        self.chain = processing.ProcessingChain.from_sessionpars(sessionpars)
+        self.sessions = {}
+
+        # Leveled stimuli, shared by all sessions
+        self._cache = audiocache.MemoCache(maxsize=cache_size)
+        self._inflight = {}
+        self._server = None
+
+
+    async def start(self):
+        """ Start listening (returns once bound) """
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port)
+        # Report the real port when started with port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("%d trials, listening on %s:%d", 
+            len(self.trials), self.host, self.port)
+
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+
+    async def _leveled(self, filename):
+        """ Leveled float32 audio for one file. Concurrent
+            requests for the same file share one decode.
+        """
+        cached = self._cache.get(filename)
+        if cached is not None:
+            return cached
+        if filename in self._inflight:
+            return await self._inflight[filename]
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[filename] = future
+        try:
+            result = await self._in_executor(self._level_file, filename)
+            self._cache.put(filename, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Waiting requests re-raise it; don't warn if none
+            future.exception()
+            raise
+        finally:
+            del self._inflight[filename]
+
+
+    def _level_file(self, filename):
+        """ Executor thread: read, process and level a file """
+        file_path = os.path.join(
+            self.sessionpars['Audio Files Path'].get(), filename)
+        audio = m.Audio(file_path,
+            self.sessionpars['Presentation Level'].get(),
+            self.sessionpars['Level Reference'].get(),
+            self.chain)
+        sig = audio.leveled().astype(np.float32)
+        if sig.ndim == 1:
+            sig = sig[:, np.newaxis]
+        return audio.fs, np.ascontiguousarray(sig)
+
+
+    async def _handle(self, reader, writer):
+        """ Serve one client connection """
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                op = msg.get('op')
+                if session is not None:
+                    logs.set_trial_id(f"{session.id}-{session.records_saved + 1}")
+                if op == 'start':
+                    session = Session(self, msg.get('subject', '999'),
+                        msg.get('condition', 'Quiet'))
+                    self.sessions[session.id] = session
+                    logger.info("Session %s started: subject %s, condition %s",
+                        session.id, msg.get('subject'), msg.get('condition'))
+                    await self._send(writer, {'ok': True,
+                        'session': session.id, 'trials': len(session.trials)})
+                elif session is None:
+                    await self._send(writer, {'ok': False,
+                        'error': "Send 'start' first"})
+                elif op == 'next':
+                    await self._next(session, writer)
+                elif op == 'submit':
+                    await self._submit(session, msg, writer)
+                elif op == 'bye':
+                    await self._send(writer, {'ok': True})
+                    break
+                else:
+                    await self._send(writer, {'ok': False,
+                        'error': f"Unknown op: {op}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Error handling client")
+        finally:
+            if session is not None:
+                logger.info("Session %s closed after %d trials",
+                    session.id, session.records_saved)
+                self.sessions.pop(session.id, None)
+            writer.close()
+
+
+    async def _next(self, session, writer):
+        """ Send the session's current trial and its audio """
+        if session.records_saved >= len(session.trials):
+            await self._send(writer, {'ok': True, 'done': True})
+            return
+        trial = session.trials[session.records_saved]
+        try:
+            leveled = await asyncio.gather(
+                *(self._leveled(f) for f in trial))
+        except Exception as e:
+            logger.exception("Could not prepare trial %s", trial)
+            await self._send(writer, {'ok': False, 'error': str(e)})
+            return
+        if len({fs for fs, _ in leveled}) > 1:
+            await self._send(writer, {'ok': False,
+                'error': "All stimuli in a trial must share the same sampling rate"})
+            return
+        await self._send(writer, {
+            'ok': True,
+            'done': False,
+            'trial': session.records_saved + 1,
+            'files': list(trial),
+            'fs': leveled[0][0],
+            'shapes': [list(sig.shape) for _, sig in leveled],
+            'isi': session.sessionpars['ISI'].get() / 1000
+        }, [sig for _, sig in leveled])
+
+
+    async def _submit(self, session, msg, writer):
+        """ Store ratings for the current trial """
+        if session.records_saved >= len(session.trials):
+            await self._send(writer, {'ok': False, 'error': "No trial to rate"})
+            return
+        trial = session.trials[session.records_saved]
+        data = dict(msg.get('ratings', {}))
+        data["Audio Filename"] = trial[0]
+        for idx, filename in enumerate(trial[1:], start=2):
+            data[f"Audio Filename {idx}"] = filename
+        data["Trajectory"] = f"trial_{session.records_saved + 1:04d}"
+        data["Trial ID"] = logs.get_trial_id()
+
+        trajectory = msg.get('trajectory')
+        def save():
+            session.model.save_record(data)
+            if trajectory:
+                names = list(trajectory)
+                arr = np.empty(len(trajectory[names[0]]),
+                    dtype=[(name, 'f4') for name in names])
+                for name in names:
+                    arr[name] = trajectory[name]
+                session.model.save_trajectory(data["Trajectory"], arr)
+        await self._in_executor(save)
+
+        session.records_saved += 1
+        await self._send(writer, {'ok': True, 'saved': session.records_saved})
+
+
+    @staticmethod
+    async def _in_executor(func, *args):
+        """ Run FUNC in the default executor with a copy of
+            the current context, so its log records carry the
+            session's trial ID
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(context.run, func, *args))
+
+
+    @staticmethod
+    async def _send(writer, msg, payload=()):
+        """ Write one JSON line plus any binary payload """
+        msg['nbytes'] = sum(arr.nbytes for arr in payload)
+        writer.write(json.dumps(msg).encode() + b'\n')
+        for arr in payload:
+            writer.write(memoryview(arr).cast('B'))
+        await writer.drain()
+
+
+class RatingClient:
+    """ Blocking client for one booth session. Used by the
+        Tk app in server mode and by the headless client.
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile('rb')
+
+
+    def _request(self, msg):
+        self._sock.sendall(json.dumps(msg).encode() + b'\n')
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        reply = json.loads(line)
+        payload = self._file.read(reply['nbytes']) if reply.get('nbytes') else b''
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error', 'Server error'))
+        return reply, payload
+
+
+    def start(self, subject, condition):
+        """ Start a session; returns the number of trials """
+        reply, _ = self._request(
+            {'op': 'start', 'subject': subject, 'condition': condition})
+        return reply['trials']
+
+
+    def next_trial(self):
+        """ Fetch the current trial. Returns None when the
+            session is finished, otherwise the reply dict
+            with a 'buffers' list of float32 arrays.
+        """
+        reply, payload = self._request({'op': 'next'})
+        if reply['done']:
+            return None
+        buffers = []
+        offset = 0
+        for shape in reply['shapes']:
+            n = shape[0] * shape[1]
+            buffers.append(np.frombuffer(payload, dtype=np.float32,
+                count=n, offset=offset).reshape(shape))
+            offset += n * 4
+        reply['buffers'] = buffers
+        return reply
+
+
+    def submit(self, ratings, trajectory=None):
+        """ Submit ratings (and optionally a structured
+            trajectory array) for the current trial
+        """
+        msg = {'op': 'submit', 'ratings': ratings}
+        if trajectory is not None:
+            msg['trajectory'] = {name: trajectory[name].tolist()
+                for name in trajectory.dtype.names}
+        reply, _ = self._request(msg)
+        return reply['saved']
+
+
+    def close(self, timeout=None):
+        """ Say goodbye and close the connection. With
+            TIMEOUT (seconds), don't wait longer than that
+            for an unresponsive server.
+        """
+        if timeout is not None:
+            self._sock.settimeout(timeout)
+        try:
+            self._request({'op': 'bye'})
+        except (OSError, RuntimeError):
+            pass
+        self._file.close()
+        self._sock.close()
+
+
+def run_headless(host, port, subject, condition, names):
+    """ Run a whole session with random ratings. Returns
+        the number of trials completed.
+    """
+    client = RatingClient(host, port)
+    completed = 0
+    try:
+        client.start(subject, condition)
+        while client.next_trial() is not None:
+            completed = client.submit(
+                {name: float(random.randint(0, 100)) for name in names})
+    finally:
+        client.close()
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rating Sliders server")
+    parser.add_argument('mode', choices=['serve', 'client'])
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--sessions', type=int, default=1,
+        help="client: number of concurrent headless sessions")
+    parser.add_argument('--condition', default='Server',
+        help="client: condition name")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        logs.setup_logging(m.SettingsModel().fields['log levels']['value'],
+            filename='rating_server.log')
+        server = RatingServer(load_sessionpars(), args.host, args.port)
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Headless clients, one thread per session
+    names = [scale['name'] for scale in m.ScalesModel().fields['Scales']['value']]
+    results = [0] * args.sessions
+    def worker(idx):
+        results[idx] = run_headless(args.host, args.port, 
+            f"headless{idx + 1:02d}", args.condition, names)
+    threads = [threading.Thread(target=worker, args=(idx,))
+        for idx in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Client: {args.sessions} sessions, {sum(results)} trials submitted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+""" Concurrency-safe output for Rating Sliders.
+
+    Every app instance (or server session) writes its own
+    shard: the usual .csv name plus a unique run ID, e.g.
+        2022_Aug_23_1015_Quiet_999.run-booth3-4120-1a2b3c.csv
+    so simultaneous writers on a shared drive never append
+    to the same file. Appends are also wrapped in an
+    advisory lock. merge_shards() combines the shards of a
+    session (and their .npz trajectory sidecars) in
+    timestamp order.
+
+    Usage:
+        python shards.py <data dir>
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import argparse
+import csv
+import logging
+import os
+import re
+import socket
+import uuid
+import zipfile
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+# Import science packages
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+logger = logging.getLogger(__name__)
+
+RUN_TAG = '.run-'
+
+
+def new_run_id():
+    """ Return a run ID unique across machines and
+        processes: host, process ID and a random suffix.
+    """
+    host = re.sub(r'[^A-Za-z0-9]', '', socket.gethostname())[:12] or 'host'
+    return f"{host}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def shard_name(base, run_id):
+    """ File name of RUN_ID's shard of BASE (a .csv name) """
+    stem, ext = os.path.splitext(base)
+    return f"{stem}{RUN_TAG}{run_id}{ext}"
+
+
+@contextmanager
+def locked(fh):
+    """ Hold an exclusive advisory lock on open file FH """
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield fh
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    else:
+        # Lock the first byte. LK_LOCK gives up with OSError
+        # after about 10 s of retries, so keep trying until
+        # the lock is free.
+        pos = fh.tell()
+        fh.seek(0)
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue
+        fh.seek(pos)
+        try:
+            yield fh
+        finally:
+            fh.flush()
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def find_shards(directory):
+    """ Group shard files in DIRECTORY by session.
+        Returns {merged .csv path: [shard paths]}.
+    """
+    groups = defaultdict(list)
+    for path in sorted(Path(directory).glob(f'*{RUN_TAG}*.csv')):
+        stem = path.name.split(RUN_TAG)[0]
+        groups[path.with_name(stem + '.csv')].append(path)
+    return dict(groups)
+
+
+def merge_shards(shards, out_path):
+    """
+        Merge shard .csv files into OUT_PATH, ordered by
+        the 'timestamp' column. Columns missing from some
+        shards are left blank. Rows whose number of cells
+        doesn't match their shard's header (e.g., the last
+        row of a shard cut short by a crash) are skipped
+        with a warning. Matching .npz trajectory sidecars
+        are merged too, with keys prefixed by run ID (the
+        'trajectory' column is updated to match).
+        Returns the number of rows written.
+    """
+    fieldnames = []
+    rows = []
+    for shard in shards:
+        with open(shard, 'r', newline='') as fh:
+            reader = csv.DictReader(fh)
+            for name in reader.fieldnames or []:
+                if name not in fieldnames:
+                    fieldnames.append(name)
+            for row in reader:
+                # DictReader fills short rows with None and
+                # puts extra cells under the key None
+                if None in row or None in row.values():
+                    logger.warning("Skipping malformed row at %s:%d",
+                        shard, reader.line_num)
+                    continue
+                rows.append(row)
+    rows.sort(key=lambda row: row.get('timestamp') or '')
+
+    # Trajectory keys are only unique within a run
+    sidecars = [Path(s).with_suffix('.npz') for s in shards]
+    sidecars = [s for s in sidecars if s.exists()]
+    if sidecars:
+        for row in rows:
+            if row.get('trajectory'):
+                row['trajectory'] = f"{row['run_id']}_{row['trajectory']}"
+
+    with open(out_path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    if sidecars:
+        out_sidecar = Path(out_path).with_suffix('.npz')
+        with zipfile.ZipFile(out_sidecar, 'w', zipfile.ZIP_DEFLATED) as out:
+            for sidecar in sidecars:
+                run_id = sidecar.stem.split(RUN_TAG)[-1]
+                with np.load(sidecar) as data:
+                    for key in data.files:
+                        with out.open(f"{run_id}_{key}.npy", 'w') as member:
+                            np.lib.format.write_array(member, data[key])
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge per-run .csv shards into one file per session")
+    parser.add_argument('directory', nargs='?', default='.')
+    args = parser.parse_args()
+
+    for out_path, shards in find_shards(args.directory).items():
+        n = merge_shards(shards, out_path)
+        print(f"{out_path.name}: {n} rows from {len(shards)} shard(s)")
+
+
+if __name__ == "__main__":
+    main()
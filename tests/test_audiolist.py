@@ -0,0 +1,77 @@
+""" Trial list checks for AudioList and CSVModel """
+
+# Import system packages
+import csv
+
+# Import testing packages
+import pytest
+
+try:
+    import models as m
+except OSError as e:
+    # sounddevice is installed but PortAudio is not
+    pytest.skip(f"models unavailable: {e}", allow_module_level=True)
+
+
+class Var:
+    """ Stand-in for a tk variable """
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def make_sessionpars(audio_dir, **overrides):
+    pars = {key: Var(data['value'])
+        for key, data in m.SessionParsModel.fields.items()}
+    pars['Audio Files Path'] = Var(str(audio_dir))
+    for key, value in overrides.items():
+        pars[key] = Var(value)
+    return pars
+
+
+@pytest.fixture
+def audio_dir(tmp_path):
+    directory = tmp_path / 'audio'
+    directory.mkdir()
+    for name in ['a.wav', 'b.wav', 'c.wav', 'd.wav', 'e.wav']:
+        (directory / name).touch()
+    return directory
+
+
+def test_mixed_length_rows_are_skipped(audio_dir, tmp_path, monkeypatch):
+    trial_list = tmp_path / 'trials.csv'
+    trial_list.write_text(
+        "first,second,third\n"
+        "a.wav,b.wav\n"
+        "c.wav,d.wav,e.wav\n"
+        "d.wav,e.wav\n"
+        "b.wav,missing.wav\n")
+    audio = m.AudioList(make_sessionpars(audio_dir,
+        **{'Stimuli Per Trial': 2, 'Trial List File': str(trial_list)}))
+
+    assert sorted(audio.fields['Trial List']) == [
+        ('a.wav', 'b.wav'), ('d.wav', 'e.wav')]
+    assert audio.fields['Skipped Trials'] == [
+        (('c.wav', 'd.wav', 'e.wav'), "3 files, expected 2"),
+        (('b.wav', 'missing.wav'), "missing file(s)")]
+    assert audio.fields['Unused Files'] == ['c.wav']
+
+    # Every saved row matches the .csv header
+    monkeypatch.chdir(tmp_path)
+    pars = make_sessionpars(audio_dir, **{'Stimuli Per Trial': 2})
+    model = m.CSVModel(pars)
+    for trial in audio.fields['Trial List']:
+        model.save_record({'Audio Filename': trial[0],
+            'Audio Filename 2': trial[1]})
+    with open(model.get_filename(), newline='') as fh:
+        rows = list(csv.reader(fh))
+    assert len(rows) == 3
+    assert all(len(row) == len(rows[0]) for row in rows)
+
+
+def test_unreadable_trial_list(audio_dir, tmp_path):
+    with pytest.raises(ValueError):
+        m.AudioList(make_sessionpars(audio_dir, **{'Stimuli Per Trial': 2,
+            'Trial List File': str(tmp_path / 'nope.csv')}))
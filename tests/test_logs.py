@@ -0,0 +1,17 @@
+""" Log level parsing checks """
+
+# Import custom modules
+import logs
+
+
+def test_unknown_levels_are_ignored():
+    levels, bad = logs.check_levels(
+        logs.parse_levels('verbose, models=debug, views=LOUD'))
+    assert levels == {'': 'INFO', 'models': 'DEBUG'}
+    assert bad == ['VERBOSE', 'views=LOUD']
+
+
+def test_root_level():
+    levels, bad = logs.check_levels(logs.parse_levels('WARNING'))
+    assert levels == {'': 'WARNING'}
+    assert bad == []
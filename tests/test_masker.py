@@ -0,0 +1,46 @@
+""" Masker compatibility checks """
+
+# Import science packages
+import numpy as np
+from scipy.io import wavfile
+
+# Import testing packages
+import pytest
+
+# Import custom modules
+import processing
+import qc
+
+
+def write(path, fs, channels, frames=4800):
+    shape = (frames,) if channels == 1 else (frames, channels)
+    data = np.random.default_rng(0).uniform(-0.1, 0.1, shape)
+    wavfile.write(path, fs, data.astype(np.float32))
+    return str(path)
+
+
+def test_masker_must_fit_stimulus(tmp_path):
+    stim = np.random.default_rng(1).uniform(-0.1, 0.1, (4800, 4))
+    stereo = write(tmp_path / 'stereo.wav', 48000, 2)
+    with pytest.raises(ValueError, match="2 channels"):
+        processing.ProcessingChain(masker_path=stereo).apply(stim, 48000)
+    with pytest.raises(ValueError, match="sampling rate"):
+        processing.ProcessingChain(masker_path=stereo).apply(stim[:, :2], 44100)
+
+    # Mono maskers go to every channel
+    mono = write(tmp_path / 'mono.wav', 48000, 1)
+    out = processing.ProcessingChain(masker_path=mono).apply(stim, 48000)
+    assert out.shape == stim.shape
+
+
+def test_qc_flags_masker_mismatch(tmp_path):
+    audio = tmp_path / 'audio'
+    audio.mkdir()
+    write(audio / 'mono.wav', 48000, 1)
+    write(audio / 'quad.wav', 48000, 4)
+    masker = write(tmp_path / 'stereo.wav', 48000, 2)
+    report = qc.scan_directory(str(audio), workers=1, masker_path=masker)
+    issues = {r['file']: r['issues'] for r in report['files']}
+    assert 'masker mismatch' not in issues['mono.wav']
+    assert 'masker mismatch' in issues['quad.wav']
+    assert "Masker:" in qc.format_table(report)
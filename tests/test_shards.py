@@ -0,0 +1,26 @@
+""" Shard merging checks """
+
+# Import system packages
+import csv
+
+# Import custom modules
+import shards
+
+
+def test_malformed_rows_are_skipped(tmp_path, caplog):
+    (tmp_path / 's.run-r1.csv').write_text(
+        "timestamp,run_id,rating\n"
+        "2026-01-02,r1,10\n"
+        "2026-01-03,r1\n"
+        "2026-01-04,r1,30,40\n")
+    (tmp_path / 's.run-r2.csv').write_text(
+        "rating,timestamp,run_id\n"
+        "50,2026-01-01,r2\n"
+        "60,,r2\n")
+    out, found = next(iter(shards.find_shards(tmp_path).items()))
+
+    assert shards.merge_shards(found, out) == 3
+    with open(out, newline='') as fh:
+        rows = list(csv.DictReader(fh))
+    assert [row['rating'] for row in rows] == ['60', '50', '10']
+    assert caplog.text.count("Skipping malformed row") == 2
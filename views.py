@@ -4,53 +4,83 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
+from tkinter import messagebox
 from tkinter.simpledialog import Dialog
 
+# Import system packages
+import functools
+import logging
+import os
+import threading
+import time
+
 # Custom widgets
 import widgets as w
 
+# Import custom modules
+import models as m
+import audiocache
+import envelope
+import processing
+import qc
+
 # Import data science packages
+import numpy as np
+import sounddevice as sd
 import matplotlib
 matplotlib.use('TkAgg')
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
 from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg, NavigationToolbar2Tk)
 
 
+logger = logging.getLogger(__name__)
+
+
 class MainFrame(ttk.Frame):
-    def __init__(self, parent, model, settings, sessionpars, *args, **kwargs):
+    """ Rating screen: one CanvasRatingSlider per scale,
+        plus Play and Submit buttons.
+
+        SCALES: list of dicts with 'name', 'question' and 
+            'anchors' keys (see models.ScalesModel). 
+            Defaults to the awareness and acceptability 
+            scales.
+        COLUMNS: number of columns to arrange scales in
+    """
+    def __init__(self, parent, model, settings, sessionpars, scales=None, 
+    columns=1, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
 
         self.model = model
         self.fields = self.model.fields
         self.settings = settings
         self.sessionpars = sessionpars
+        self.scales = scales or m.ScalesModel.fields['Scales']['value']
+        columns = max(1, columns)
 
 
-        def get_current_value():
-            """ Retrieves current slider values """
-            return int(self._vars['Awareness Rating'].get()), int(self._vars['Acceptability Rating'].get())
-
-
-        def slider_changed(event):
-            """ Updates slider values when moved """
-            self._vars['Awareness Rating'].set(get_current_value()[0])
-            self._vars['Acceptability Rating'].set(get_current_value()[1])
+        def slider_changed(idx, value):
+            """ Records slider values when moved (the slider
+                has already updated its own variable)
+            """
+            self._values[idx] = value
+            self.trajectory.record(*self._values)
 
 
         # Data dictionary
         self._vars = {
-            'Awareness Rating': tk.DoubleVar(value=50),
-            'Acceptability Rating': tk.DoubleVar(value=50),
-            'Audio Filename': tk.StringVar()
-        }
-
-        # Verbal anchors
-        aware_anchors = ['Not\nAware', 'Slightly\nAware', 
-            'Somewhat\nAware', 'Moderately\nAware', 'Extremely\nAware']
-        accept_anchors = ['Not\nAcceptable', 'Slightly\nAcceptable', 
-            'Somewhat\nAcceptable', 'Moderately\nAcceptable', 
-            'Extremely\nAcceptable']
+            scale['name']: tk.DoubleVar(value=50) for scale in self.scales}
+        self._vars['Audio Filename'] = tk.StringVar()
+        # Latest value of each slider, in scale order
+        self._values = [50] * len(self.scales)
+
+        # Slider movements for the current trial
+        self.trajectory = m.TrajectoryBuffer(
+            [scale['name'] for scale in self.scales])
+        # When the screen was last ready for a new trial
+        self.ready_time = time.perf_counter()
 
         # Styles
         # These are global settings
@@ -59,27 +89,21 @@ class MainFrame(ttk.Frame):
         style.configure('TLabelframe.Label', font=("Helvetica", 11))
         style.configure('TButton', font=("Helvetica", 10))
 
-        # Awareness Slider
-        w.RatingSlider(self, 
-            question="Please rate how aware you were of the transition:",
-            anchors=aware_anchors, 
-            slider_args={'from_':0, 'to':100, 'length':500, 
-                'orient':'horizontal', 'command':slider_changed, 
-                'variable':self._vars['Awareness Rating']}
-            ).grid(row=5,column=0)
-
-        # Acceptability Slider
-        w.RatingSlider(self, 
-            question="Please rate how acceptable the transition was:",
-            anchors=accept_anchors, 
-            slider_args={'from_':0, 'to':100, 'length':500, 
-                'orient':'horizontal', 'command':slider_changed, 
-                'variable':self._vars['Acceptability Rating']}
-            ).grid(row=10,column=0)
+        # Rating sliders
+        for idx, scale in enumerate(self.scales):
+            w.CanvasRatingSlider(self, 
+                question=scale['question'],
+                anchors=scale['anchors'], 
+                variable=self._vars[scale['name']],
+                from_=0, to=100, length=500,
+                command=functools.partial(slider_changed, idx)
+                ).grid(row=idx // columns, column=idx % columns, 
+                    padx=30, pady=(20,0))
 
         # Button frame
         frm_button = ttk.Frame(self)
-        frm_button.grid(row=15, column=0, columnspan=5, padx=20, pady=20)
+        frm_button.grid(row=len(self.scales) // columns + 1, column=0, 
+            columnspan=columns, padx=20, pady=20)
 
         # Play button
         self.btn_play = ttk.Button(frm_button, text="Play", command=self.play)
@@ -116,10 +140,21 @@ class MainFrame(ttk.Frame):
         return data
 
 
+    def start_trial(self):
+        """ Restart the slider trajectory at stimulus onset,
+            with the current slider values at t=0
+        """
+        self.trajectory.start(*self._values)
+
+
     def reset(self):
         """ Clear all values """   
         for var in self._vars.values():
             var.set(50)
+        self._values = [50] * len(self.scales)
+        # Clear the trajectory (restarted at stimulus onset)
+        self.trajectory.start()
+        self.ready_time = time.perf_counter()
         # Disable submit button on press
         # Set focus to play button
         self.btn_submit.config(state="disabled")
@@ -160,6 +195,13 @@ class SessionParams(Dialog):
             textvariable=self.sessionpars['Presentation Level']
             ).grid(row=4, column=1, sticky='w')
 
+        # Level reference
+        ttk.Label(frame, text="Level Reference:"
+            ).grid(row=4, column=2, sticky='e', **options)
+        ttk.Combobox(frame, width=6, state='readonly', values=['RMS', 'LUFS'],
+            textvariable=self.sessionpars['Level Reference']
+            ).grid(row=4, column=3, sticky='w')
+
         # Directory
         frm_path = ttk.LabelFrame(frame, text="Please select audio file directory")
         frm_path.grid(row=5, column=0, columnspan=2, **options, ipadx=5, ipady=5)
@@ -171,20 +213,144 @@ class SessionParams(Dialog):
             ).grid(row=5, column=1, sticky='w')
         ttk.Button(my_frame, text="Browse", command=self._get_directory
             ).grid(row=6, column=1, sticky='w')
+        self.btn_qc = ttk.Button(my_frame, text="Check Files...", 
+            command=self._check_files)
+        self.btn_qc.grid(row=6, column=1, sticky='e')
+
+        # Trial structure
+        frm_trial = ttk.LabelFrame(frame, text="Trials")
+        frm_trial.grid(row=8, column=0, columnspan=4, sticky='we', **options)
+        ttk.Label(frm_trial, text="Stimuli per trial:"
+            ).grid(row=0, column=0, sticky='e', **options)
+        ttk.Entry(frm_trial, width=8, 
+            textvariable=self.sessionpars['Stimuli Per Trial']
+            ).grid(row=0, column=1, sticky='w')
+        ttk.Label(frm_trial, text="ISI (ms):"
+            ).grid(row=0, column=2, sticky='e', **options)
+        ttk.Entry(frm_trial, width=8, 
+            textvariable=self.sessionpars['ISI']
+            ).grid(row=0, column=3, sticky='w')
+        ttk.Label(frm_trial, text="Trial list (.csv):"
+            ).grid(row=1, column=0, sticky='e', **options)
+        ttk.Label(frm_trial, textvariable=self.sessionpars['Trial List File'], 
+            borderwidth=2, relief="solid", width=40
+            ).grid(row=1, column=1, columnspan=3, sticky='w')
+        ttk.Button(frm_trial, text="Browse", command=self._get_trial_list
+            ).grid(row=1, column=4, sticky='w', **options)
+
+        # Processing chain
+        frm_proc = ttk.LabelFrame(frame, text="Processing")
+        frm_proc.grid(row=7, column=0, columnspan=4, sticky='we', **options)
+        ttk.Label(frm_proc, text="Ramps (ms):"
+            ).grid(row=0, column=0, sticky='e', **options)
+        ttk.Entry(frm_proc, width=8, 
+            textvariable=self.sessionpars['Ramp Duration']
+            ).grid(row=0, column=1, sticky='w')
+        ttk.Label(frm_proc, text="Filter:"
+            ).grid(row=1, column=0, sticky='e', **options)
+        ttk.Combobox(frm_proc, width=10, state='readonly', 
+            values=processing.FILTER_TYPES,
+            textvariable=self.sessionpars['Filter Type']
+            ).grid(row=1, column=1, sticky='w')
+        ttk.Combobox(frm_proc, width=5, state='readonly', 
+            values=processing.FILTER_DESIGNS,
+            textvariable=self.sessionpars['Filter Design']
+            ).grid(row=1, column=2, sticky='w', **options)
+        ttk.Label(frm_proc, text="Cutoffs (Hz):"
+            ).grid(row=2, column=0, sticky='e', **options)
+        ttk.Entry(frm_proc, width=8, 
+            textvariable=self.sessionpars['Low Cutoff']
+            ).grid(row=2, column=1, sticky='w')
+        ttk.Entry(frm_proc, width=8, 
+            textvariable=self.sessionpars['High Cutoff']
+            ).grid(row=2, column=2, sticky='w', **options)
+        ttk.Label(frm_proc, text="Masker:"
+            ).grid(row=3, column=0, sticky='e', **options)
+        ttk.Label(frm_proc, textvariable=self.sessionpars['Masker Path'], 
+            borderwidth=2, relief="solid", width=40
+            ).grid(row=3, column=1, columnspan=2, sticky='w')
+        ttk.Button(frm_proc, text="Browse", command=self._get_masker
+            ).grid(row=3, column=3, sticky='w', **options)
+        ttk.Label(frm_proc, text="SNR (dB):"
+            ).grid(row=4, column=0, sticky='e', **options)
+        ttk.Entry(frm_proc, width=8, 
+            textvariable=self.sessionpars['SNR']
+            ).grid(row=4, column=1, sticky='w')
 
     def _get_directory(self):
         # Ask user to specify audio files directory
         self.sessionpars['Audio Files Path'].set(filedialog.askdirectory())
 
 
+    def _check_files(self):
+        """ Run the stimulus QC scan in the background and
+            show the results when finished.
+        """
+        directory = self.sessionpars['Audio Files Path'].get()
+        if not os.path.isdir(directory):
+            messagebox.showwarning(parent=self, title="No path selected",
+                message="Please select a valid audio file directory!")
+            return
+        try:
+            level = self.sessionpars['Presentation Level'].get()
+        except tk.TclError:
+            messagebox.showwarning(parent=self, title="Invalid level",
+                message="Please enter a valid presentation level!")
+            return
+        # Read every Tk variable here: they aren't safe to
+        # touch from the QC thread
+        reference = self.sessionpars['Level Reference'].get()
+        masker_path = self.sessionpars['Masker Path'].get()
+
+        self.btn_qc.config(state='disabled', text="Checking...")
+        result = {}
+        def scan():
+            try:
+                result['report'] = qc.scan_directory(directory, level,
+                    reference, masker_path=masker_path)
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=scan, daemon=True)
+        thread.start()
+        self._poll_check_files(thread, result)
+
+
+    def _poll_check_files(self, thread, result):
+        """ Wait for the QC thread without blocking the UI """
+        if thread.is_alive():
+            self.after(100, self._poll_check_files, thread, result)
+            return
+        if not self.winfo_exists():
+            return
+        self.btn_qc.config(state='normal', text="Check Files...")
+        if 'error' in result:
+            messagebox.showerror(parent=self, title="QC failed",
+                message=str(result['error']))
+        else:
+            QCReport(self, result['report'])
+
+
+    def _get_masker(self):
+        # Ask user for a masker file (cancel clears it)
+        self.sessionpars['Masker Path'].set(filedialog.askopenfilename(
+            filetypes=[('Audio files', ' '.join(
+                '*' + ext for ext in audiocache.AUDIO_EXTENSIONS))]))
+
+
+    def _get_trial_list(self):
+        # Ask user for a trial list file (cancel clears it)
+        self.sessionpars['Trial List File'].set(filedialog.askopenfilename(
+            filetypes=[('CSV files', '*.csv')]))
+
+
     def ok(self):
-        print("View:184: Sending save event...")
+        logger.debug("Sending save event...")
         self.parent.event_generate('<<ParsDialogOk>>')
         self.destroy()
 
     
     def cancel(self):
-        print("View:190: Sending load event...")
+        logger.debug("Sending load event...")
         self.parent.event_generate('<<ParsDialogCancel>>')
         self.destroy()
 
@@ -193,3 +359,480 @@ class SessionParams(Dialog):
     #     # Send event to main window on "ok"
     #     #self.parent.event_generate('<<ParsDialogOk>>')
     #     pass
+
+
+class QCReport(tk.Toplevel):
+    """ A window showing stimulus QC results """
+    def __init__(self, parent, report, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.report = report
+        self.title("Stimulus Check")
+
+        self._problems_only = tk.BooleanVar(value=True)
+        frm_options = ttk.Frame(self)
+        frm_options.grid(row=0, column=0, sticky='we', padx=10, pady=5)
+        ttk.Checkbutton(frm_options, text="Only show files with issues",
+            variable=self._problems_only, command=self._show
+            ).grid(row=0, column=0, sticky='w')
+        ttk.Button(frm_options, text="Save JSON...", command=self._save
+            ).grid(row=0, column=1, sticky='e', padx=10)
+
+        self.txt = tk.Text(self, width=110, height=30, wrap='none', 
+            font=("Courier", 9))
+        self.txt.grid(row=1, column=0, sticky='nsew', padx=10, pady=(0,10))
+        scroll = ttk.Scrollbar(self, orient='vertical', command=self.txt.yview)
+        scroll.grid(row=1, column=1, sticky='ns', pady=(0,10))
+        self.txt.config(yscrollcommand=scroll.set)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self._show()
+
+
+    def _show(self):
+        """ Fill the text box with the report table """
+        self.txt.config(state='normal')
+        self.txt.delete('1.0', 'end')
+        self.txt.insert('1.0', qc.format_table(self.report, 
+            problems_only=self._problems_only.get()))
+        self.txt.config(state='disabled')
+
+
+    def _save(self):
+        """ Write the full report as JSON """
+        filename = filedialog.asksaveasfilename(parent=self, 
+            defaultextension='.json', filetypes=[('JSON files', '*.json')])
+        if filename:
+            qc.to_json(self.report, filename)
+
+
+class TextReport(tk.Toplevel):
+    """ A read-only window showing a text report
+        (e.g., a profiling comparison)
+    """
+    def __init__(self, parent, title, text, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.text = text
+        self.title(title)
+
+        ttk.Button(self, text="Save...", command=self._save
+            ).grid(row=0, column=0, sticky='e', padx=10, pady=5)
+        txt = tk.Text(self, width=130, height=35, wrap='none', 
+            font=("Courier", 9))
+        txt.grid(row=1, column=0, sticky='nsew', padx=10, pady=(0,10))
+        scroll = ttk.Scrollbar(self, orient='vertical', command=txt.yview)
+        scroll.grid(row=1, column=1, sticky='ns', pady=(0,10))
+        txt.config(yscrollcommand=scroll.set)
+        txt.insert('1.0', text)
+        txt.config(state='disabled')
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+
+    def _save(self):
+        """ Write the report to a text file """
+        filename = filedialog.asksaveasfilename(parent=self, 
+            defaultextension='.txt', filetypes=[('Text files', '*.txt')])
+        if filename:
+            with open(filename, 'w') as fh:
+                fh.write(self.text)
+
+
+class Dashboard(tk.Toplevel):
+    """ Experimenter window with running session results.
+
+        Top: mean (+/- 1 SD) rating per stimulus for each
+        scale. Bottom: 2D histogram of the first two scales.
+        Plotted values live in preallocated arrays that are
+        updated in place, one stimulus row at a time. After
+        a trial, only that stimulus' column (and the
+        histogram) is restored from the cached background
+        and redrawn, from the rows around it, then blitted.
+        The whole series is drawn only on full draws.
+
+        SUMMARY: a models.RatingSummary
+        N_STIMULI: expected number of stimuli (x axis size)
+    """
+    colors = ['tab:blue', 'tab:orange', 'tab:green', 'tab:red', 
+        'tab:purple', 'tab:brown', 'tab:pink', 'tab:gray']
+    markersize = 4
+
+    def __init__(self, parent, summary, n_stimuli, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.title("Experimenter Dashboard")
+        self.summary = summary
+        self._background = None
+
+        self.fig = Figure(figsize=(7, 6), dpi=100)
+        self.ax_means = self.fig.add_subplot(2, 1, 1)
+        self.ax_hist = self.fig.add_subplot(2, 1, 2)
+
+        # Per-stimulus means and error bars, indexed
+        # [stimulus, scale]. Each scale has artists for the
+        # whole series and for the few stimuli around an
+        # updated column.
+        n_scales = len(summary.names)
+        self._capacity = max(n_stimuli, len(summary.stats), 1)
+        self._x = np.arange(self._capacity, dtype=float)
+        self._means = np.full((self._capacity, n_scales), np.nan)
+        self._segments = np.full((self._capacity, n_scales, 2, 2), np.nan)
+        self._series = []
+        self._local = []
+        for idx, name in enumerate(summary.names):
+            color = self.colors[idx % len(self.colors)]
+            for artists, label in [(self._series, name), (self._local, None)]:
+                bars = LineCollection([], colors=color, animated=True)
+                self.ax_means.add_collection(bars)
+                line, = self.ax_means.plot([], [], 'o', color=color, 
+                    markersize=self.markersize, label=label, animated=True)
+                artists.append((bars, line))
+        self.ax_means.set_xlim(-0.5, self._capacity - 0.5)
+        self.ax_means.set_ylim(0, 100)
+        self.ax_means.set_xlabel("Stimulus (in order rated)")
+        self.ax_means.set_ylabel("Mean rating")
+        self.ax_means.legend(handles=[line for _, line in self._series], 
+            loc='upper right', fontsize=8)
+
+        # Rating distribution
+        self._image = self.ax_hist.imshow(summary.hist, origin='lower', 
+            extent=(0, 100, 0, 100), cmap='Blues', aspect='auto', 
+            interpolation='nearest', animated=True)
+        if len(summary.names) >= 2:
+            self.ax_hist.set_xlabel(summary.names[0])
+            self.ax_hist.set_ylabel(summary.names[1])
+        self.fig.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self)
+        self.canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+        # Fill in anything rated before the window opened
+        for idx in range(len(summary.stats)):
+            self._update_stimulus(idx)
+        self.canvas.draw()
+
+
+    def _on_draw(self, event):
+        """ Cache the static background after a full draw
+            (first show, resize) and draw the dynamic artists
+        """
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_means(self._series, slice(None))
+        self.ax_hist.draw_artist(self._image)
+
+
+    def _draw_means(self, artists, stims):
+        """ Draw the means and error bars of the stimuli in
+            slice STIMS with ARTISTS (self._series or
+            self._local)
+        """
+        for idx, (bars, line) in enumerate(artists):
+            bars.set_segments(self._segments[stims, idx])
+            line.set_data(self._x[stims], self._means[stims, idx])
+            self.ax_means.draw_artist(bars)
+            self.ax_means.draw_artist(line)
+
+
+    def _grow(self, size):
+        """ Enlarge the preallocated arrays (rare: more
+            stimuli than expected)
+        """
+        old = self._capacity
+        self._capacity = max(size, 2 * old)
+        self._x = np.arange(self._capacity, dtype=float)
+        means = np.full((self._capacity,) + self._means.shape[1:], np.nan)
+        means[:old] = self._means
+        segments = np.full((self._capacity,) + self._segments.shape[1:], 
+            np.nan)
+        segments[:old] = self._segments
+        self._means = means
+        self._segments = segments
+        self.ax_means.set_xlim(-0.5, self._capacity - 0.5)
+
+
+    def _update_stimulus(self, stim):
+        """ Copy one stimulus' summary into its row of the
+            plot data
+        """
+        if stim >= self._capacity:
+            self._grow(stim + 1)
+        for idx, stats in enumerate(self.summary.stats[stim]):
+            self._means[stim, idx] = stats.mean
+            self._segments[stim, idx] = [
+                [stim, stats.mean - stats.std], [stim, stats.mean + stats.std]]
+        self._image.set_data(self.summary.hist)
+        self._image.set_clim(0, max(self.summary.hist.max(), 1))
+
+
+    def _column(self, stim):
+        """ Display bbox of STIM's column (widened by a
+            marker, in whole pixels), the slice of stimuli
+            drawn into it, and a wider bbox that covers
+            everything those stimuli touch
+        """
+        axes = self.ax_means.bbox
+        figure = self.fig.bbox
+        # Marker radius, plus a pixel of antialiasing
+        pad = self.markersize * self.fig.dpi / 72 / 2 + 1
+        width = axes.width / self._capacity
+        reach = int(np.ceil(0.5 + 2 * pad / width))
+        stims = slice(max(stim - reach, 0), stim + reach + 1)
+
+        # Markers at the edge of the axes spill past it
+        left, right = self.ax_means.transData.transform(
+            [(stim - 0.5, 0), (stim + 0.5, 0)])[:, 0]
+        column, guard = [Bbox(np.array([
+            np.floor([max(left - extra, 0), axes.y0 - pad]), 
+            np.ceil([min(right + extra, figure.x1), axes.y1 + pad])]))
+            for extra in (pad, reach * width + 2 * pad)]
+        return column, guard, stims
+
+
+    def _restore(self, region, bbox):
+        """ Restore the whole pixels under BBOX (display
+            coords) from REGION (a copy_from_bbox() region).
+            Regions are addressed top-down, with inclusive
+            far edges.
+        """
+        height = self.fig.bbox.height
+        x0, y0 = np.floor([bbox.x0, height - bbox.y1])
+        x1, y1 = np.ceil([bbox.x1, height - bbox.y0]) - 1
+        if x1 < x0 or y1 < y0:
+            return
+        self.canvas.restore_region(region, bbox=(x0, y0, x1, y1), 
+            xy=region.get_extents()[:2])
+
+
+    def update_plot(self, stim):
+        """ Show the latest trial for stimulus index STIM """
+        grew = stim >= self._capacity
+        self._update_stimulus(stim)
+        if grew or self._background is None:
+            # Axis limits changed: full redraw
+            self.canvas.draw()
+            return
+        # Erase STIM's column and redraw the stimuli that
+        # reach into it. They are drawn whole, so put back
+        # what's on either side of the column afterwards.
+        column, guard, stims = self._column(stim)
+        beside = self.canvas.copy_from_bbox(guard)
+        self._restore(self._background, column)
+        self._draw_means(self._local, stims)
+        self._restore(beside, Bbox([[guard.x0, guard.y0], 
+            [column.x0, guard.y1]]))
+        self._restore(beside, Bbox([[column.x1, guard.y0], 
+            [guard.x1, guard.y1]]))
+
+        self._restore(self._background, self.ax_hist.bbox)
+        self.ax_hist.draw_artist(self._image)
+        self.canvas.blit(column)
+        self.canvas.blit(self.ax_hist.bbox)
+
+
+class PreviewWindow(tk.Toplevel):
+    """ Stimulus preview: waveform envelope with zoom/pan
+        (matplotlib toolbar) and click-to-play scrubbing.
+
+        Envelopes come from envelope.get_pyramid, so each
+        redraw plots only about a screen width of points
+        whatever the zoom level. Pyramids for every file
+        are built in a background thread when the window
+        opens; a selected file that isn't ready yet is
+        built first.
+    """
+    def __init__(self, parent, sessionpars, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.title("Stimulus Preview")
+        self.sessionpars = sessionpars
+        self.directory = sessionpars['Audio Files Path'].get()
+        self._pyramid = None
+        self._fill = None
+        self._redraw_id = None
+        self._path = None
+        self._leveled = None
+        self._leveling = None # path being leveled in a thread
+        self._play_at = None # time to play from once leveled
+
+        try:
+            files = sorted(f for f in os.listdir(self.directory)
+                if audiocache.is_audio_file(f))
+        except OSError:
+            files = []
+
+        # File list
+        frm_files = ttk.Frame(self)
+        frm_files.grid(row=0, column=0, sticky='ns', padx=10, pady=10)
+        self.lst_files = tk.Listbox(frm_files, width=35, height=25, 
+            exportselection=False)
+        self.lst_files.grid(row=0, column=0, sticky='ns')
+        scroll = ttk.Scrollbar(frm_files, orient='vertical', 
+            command=self.lst_files.yview)
+        scroll.grid(row=0, column=1, sticky='ns')
+        self.lst_files.config(yscrollcommand=scroll.set)
+        for f in files:
+            self.lst_files.insert('end', f)
+        self.lst_files.bind('<<ListboxSelect>>', self._on_select)
+        ttk.Button(frm_files, text="Stop", command=self._stop
+            ).grid(row=1, column=0, sticky='w', pady=(5,0))
+        self.status = tk.StringVar(value="Click the waveform to play from that point")
+        ttk.Label(frm_files, textvariable=self.status, wraplength=220
+            ).grid(row=2, column=0, columnspan=2, sticky='w', pady=(5,0))
+
+        # Waveform
+        frm_plot = ttk.Frame(self)
+        frm_plot.grid(row=0, column=1, sticky='nsew', padx=(0,10), pady=10)
+        self.columnconfigure(1, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.fig = Figure(figsize=(8, 3.5), dpi=100)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_ylim(-1, 1)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=frm_plot)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, frm_plot)
+        self.toolbar.update()
+        self.canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.canvas.mpl_connect('button_press_event', self._on_click)
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim)
+        self.fig.tight_layout()
+        self.canvas.draw()
+
+        # Build all pyramids in the background
+        paths = [os.path.join(self.directory, f) for f in files]
+        threading.Thread(target=self._build_all, args=(paths,), 
+            daemon=True).start()
+
+
+    @staticmethod
+    def _build_all(paths):
+        """ Background thread: build and store pyramids """
+        for path in paths:
+            try:
+                envelope.get_pyramid(path)
+            except Exception:
+                # Unreadable files are reported when selected
+                pass
+
+
+    def _on_select(self, *_):
+        """ Load the selected file's pyramid in a thread """
+        selection = self.lst_files.curselection()
+        if not selection:
+            return
+        path = os.path.join(self.directory, self.lst_files.get(selection[0]))
+        self.status.set("Loading...")
+        result = {}
+        def load():
+            try:
+                result['pyramid'] = envelope.get_pyramid(path)
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        self._poll_load(thread, result, path)
+
+
+    def _poll_load(self, thread, result, path):
+        if thread.is_alive():
+            self.after(50, self._poll_load, thread, result, path)
+            return
+        if not self.winfo_exists():
+            return
+        if 'error' in result:
+            self.status.set(f"Could not read file: {result['error']}")
+            return
+        self._path = path
+        self._leveled = None
+        self._pyramid = result['pyramid']
+        self.status.set("Click the waveform to play from that point")
+        self.toolbar.update() # reset zoom history
+        self.ax.set_xlim(0, self._pyramid.frames / self._pyramid.fs)
+
+
+    def _on_xlim(self, *_):
+        """ Zoom or pan: redraw once things settle """
+        if self._redraw_id is None:
+            self._redraw_id = self.after_idle(self._redraw)
+
+
+    def _redraw(self):
+        """ Plot the envelope for the current view """
+        self._redraw_id = None
+        if self._pyramid is None:
+            return
+        t0, t1 = self.ax.get_xlim()
+        width = self.canvas.get_tk_widget().winfo_width()
+        times, mins, maxs = self._pyramid.view(t0, t1, max(width, 100))
+        if self._fill is not None:
+            self._fill.remove()
+        self._fill = self.ax.fill_between(times, mins, maxs, 
+            color='steelblue', linewidth=0.5)
+        self.canvas.draw_idle()
+
+
+    def _on_click(self, event):
+        """ Play from the clicked time (when not zooming
+            or panning). The file is decoded and leveled in
+            a thread on the first click, then replayed from
+            any point.
+        """
+        if (event.inaxes is not self.ax or self._pyramid is None or 
+        self.toolbar.mode):
+            return
+        self._play_at = max(event.xdata, 0)
+        if self._leveled is not None:
+            self._play()
+            return
+        if self._leveling == self._path:
+            # Already loading: play from the latest click
+            return
+
+        # Read the Tk variables here, not in the thread
+        path = self._path
+        level = self.sessionpars['Presentation Level'].get()
+        reference = self.sessionpars['Level Reference'].get()
+        chain = processing.ProcessingChain.from_sessionpars(self.sessionpars)
+        self._leveling = path
+        self.status.set("Loading audio...")
+        result = {}
+        def level_audio():
+            try:
+                audio = m.Audio(path, level, reference, chain)
+                result['leveled'] = (audio.leveled(), audio.fs)
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=level_audio, daemon=True)
+        thread.start()
+        self._poll_level(thread, result, path)
+
+
+    def _poll_level(self, thread, result, path):
+        if thread.is_alive():
+            self.after(50, self._poll_level, thread, result, path)
+            return
+        if not self.winfo_exists():
+            return
+        if self._leveling == path:
+            self._leveling = None
+        if path != self._path:
+            # Another file was selected meanwhile
+            return
+        if 'error' in result:
+            self.status.set(f"Could not play file: {result['error']}")
+            return
+        self._leveled = result['leveled']
+        self.status.set("Click the waveform to play from that point")
+        self._play()
+
+
+    def _play(self):
+        """ Play the leveled file from self._play_at """
+        if self._play_at is None:
+            # Stopped while loading
+            return
+        sig, fs = self._leveled
+        sd.play(sig[int(self._play_at * fs):], fs)
+
+
+    def _stop(self):
+        self._play_at = None
+        sd.stop()
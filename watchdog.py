@@ -0,0 +1,231 @@
+""" Tk event-loop stall watchdog for Rating Sliders.
+
+    A repeating after() callback measures how late the Tk
+    mainloop runs it (scheduling drift). A background
+    thread watches for the callback going quiet: while the
+    mainloop is stalled, it samples the main thread's
+    stack with sys._current_frames(), so we can see what
+    the UI was doing (e.g., decoding audio in _on_play,
+    or writing the .csv in save_record). Delays longer
+    than the threshold are reported as stalls.
+
+    At the end of the session, a drift histogram and the
+    worst stalls with their most-sampled stacks are written
+    to ~/rating_tool_logs/stalls_<date>.json and .txt.
+
+    Created: Oct 18, 2026
+"""
+
+# Import system packages
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime
+
+# Import custom modules
+import logs
+
+
+logger = logging.getLogger(__name__)
+
+# Upper edges (ms) of the drift histogram bins
+DRIFT_BINS = [5, 10, 25, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class StallWatchdog:
+    """ Measures mainloop responsiveness for one session.
+
+        ROOT: the Tk root window
+        INTERVAL_MS: heartbeat period
+        THRESHOLD_MS: drift that counts as a stall
+        SAMPLE_MS: stack sampling period during stalls
+        MAX_STALLS: number of worst stalls to report
+        DEPTH: stack frames kept per sample
+    """
+    def __init__(self, root, interval_ms=50, threshold_ms=200, sample_ms=10,
+    max_stalls=20, depth=12):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.sample = sample_ms / 1000
+        self.max_stalls = max_stalls
+        self.depth = depth
+
+        self.histogram = [0] * (len(DRIFT_BINS) + 1)
+        self.n_ticks = 0
+        self.max_drift = 0.0
+        self.n_stalls = 0
+        self._worst = [] # heap of (duration, index, stall)
+        self._stack_totals = Counter() # stack -> samples in all stalls
+
+        self._lock = threading.Lock()
+        self._samples = Counter() # stack -> samples, current stall
+        self._main_ident = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._thread = None
+        self._after_id = None
+        self._started = None
+
+
+    def start(self):
+        """ Start the heartbeat and the sampling thread """
+        self._started = datetime.now()
+        self._last_tick = time.perf_counter()
+        self._expected = self._last_tick + self.interval
+        self._after_id = self.root.after(int(self.interval * 1000), self._tick)
+        self._thread = threading.Thread(target=self._monitor, daemon=True,
+            name='StallWatchdog')
+        self._thread.start()
+
+
+    def _tick(self):
+        """ Heartbeat, run by the Tk mainloop """
+        now = time.perf_counter()
+        drift = max(now - self._expected, 0.0)
+        self._last_tick = now
+        self.n_ticks += 1
+        self.max_drift = max(self.max_drift, drift)
+        self.histogram[bisect_right(DRIFT_BINS, drift * 1000)] += 1
+        if drift > self.threshold:
+            self._close_stall(drift)
+        else:
+            # Short delay: discard any samples taken
+            with self._lock:
+                self._samples.clear()
+        self._expected = now + self.interval
+        self._after_id = self.root.after(int(self.interval * 1000), self._tick)
+
+
+    def _monitor(self):
+        """ Sampling thread: record the main thread's stack
+            while the heartbeat is overdue. Sampling starts
+            before the threshold is reached so the whole
+            stall is covered; _tick() keeps or discards it.
+        """
+        while not self._stop.wait(self.sample):
+            overdue = time.perf_counter() - self._last_tick - self.interval
+            if overdue < self.sample:
+                continue
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            stack = tuple(
+                (f.filename, f.lineno, f.name)
+                for f in traceback.extract_stack(frame)[-self.depth:])
+            del frame
+            with self._lock:
+                self._samples[stack] += 1
+
+
+    def _close_stall(self, drift):
+        """ Store a finished stall with its sampled stacks """
+        with self._lock:
+            samples, self._samples = self._samples, Counter()
+        self.n_stalls += 1
+        self._stack_totals.update(samples)
+        top = samples.most_common(3)
+        stall = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'trial_id': logs.get_trial_id(),
+            'duration_ms': round(drift * 1000, 1),
+            'samples': sum(samples.values()),
+            'stacks': [{'count': n, 'stack': _format_stack(s)} for s, n in top]
+        }
+        where = _format_stack(top[0][0])[-1] if top else 'not sampled'
+        logger.warning("UI stalled for %.0f ms in %s", drift * 1000, where)
+
+        entry = (drift, self.n_stalls, stall)
+        if len(self._worst) < self.max_stalls:
+            heapq.heappush(self._worst, entry)
+        else:
+            heapq.heappushpop(self._worst, entry)
+
+
+    def report(self):
+        """ Return the session report as a dictionary """
+        labels = [f"<{DRIFT_BINS[0]}"]
+        labels += [f"{lo}-{hi}" for lo, hi in zip(DRIFT_BINS, DRIFT_BINS[1:])]
+        labels += [f">{DRIFT_BINS[-1]}"]
+        return {
+            'started': self._started.isoformat(timespec='seconds') if self._started else None,
+            'interval_ms': self.interval * 1000,
+            'threshold_ms': self.threshold * 1000,
+            'heartbeats': self.n_ticks,
+            'max_drift_ms': round(self.max_drift * 1000, 1),
+            'drift_histogram_ms': dict(zip(labels, self.histogram)),
+            'stalls': self.n_stalls,
+            'worst_stalls': [s for _, _, s in sorted(self._worst, reverse=True)],
+            'top_stacks': [{'samples': n, 'stack': _format_stack(s)}
+                for s, n in self._stack_totals.most_common(10)]
+        }
+
+
+    def stop(self, write=True):
+        """ Stop watching and (optionally) write the report.
+            Returns the report file path, if written.
+        """
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            # Root already destroyed
+            pass
+        if write:
+            return self.write_report()
+
+
+    def write_report(self, directory=None):
+        """ Write the report as JSON and as text """
+        directory = directory or logs.LOG_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = (self._started or datetime.now()).strftime("%Y_%b_%d_%H%M%S")
+        report = self.report()
+        json_path = directory / f"stalls_{stamp}.json"
+        with open(json_path, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        with open(json_path.with_suffix('.txt'), 'w') as fh:
+            fh.write(format_report(report))
+        logger.info("Stall report written to %s", json_path)
+        return json_path
+
+
+def _format_stack(stack):
+    """ 'file:line in func' strings, outermost first """
+    return [f"{filename}:{lineno} in {name}" for filename, lineno, name in stack]
+
+
+def format_report(report):
+    """ Readable text version of a report """
+    lines = [
+        f"Session started: {report['started']}",
+        f"Heartbeats: {report['heartbeats']} every {report['interval_ms']:.0f} ms",
+        f"Max drift: {report['max_drift_ms']} ms",
+        f"Stalls over {report['threshold_ms']:.0f} ms: {report['stalls']}",
+        "",
+        "Drift histogram (ms):"
+    ]
+    for label, count in report['drift_histogram_ms'].items():
+        lines.append(f"  {label:>10}: {count}")
+    lines += ["", "Worst stalls:"]
+    for stall in report['worst_stalls']:
+        lines.append(f"  {stall['duration_ms']:>8.0f} ms at {stall['time']} "
+            f"(trial {stall['trial_id']}, {stall['samples']} samples)")
+        if stall['stacks']:
+            for frame in stall['stacks'][0]['stack'][-4:]:
+                lines.append(f"      {frame}")
+    lines += ["", "Most sampled stacks:"]
+    for entry in report['top_stacks']:
+        lines.append(f"  {entry['samples']} samples:")
+        for frame in entry['stack'][-6:]:
+            lines.append(f"      {frame}")
+    return '\n'.join(lines) + '\n'
@@ -38,3 +38,109 @@ class RatingSlider(tk.Frame):
         ttk.Label(self, textvariable=slider_args['variable']).place(in_=frm_slider, relx=0.53, rely=0.8, anchor='e')
 
         self.update()
+
+
+class CanvasRatingSlider(tk.Canvas):
+    """ A rating slider drawn on a single Canvas.
+
+        Lighter than RatingSlider: the question, anchors,
+        track, thumb and value are canvas items rather than
+        separate widgets, and pointer motion is coalesced
+        so the variable, value text and COMMAND are updated
+        at most once per frame.
+
+        VARIABLE: a tk variable holding the rating
+        COMMAND: called with the new (int) value
+    """
+    FRAME_MS = 16 # ~60 updates per second
+
+    def __init__(self, parent, question, anchors, variable, from_=0, 
+    to=100, length=500, command=None, **kwargs):
+        kwargs.setdefault('width', length + 100)
+        kwargs.setdefault('height', 150)
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(parent, **kwargs)
+        self.variable = variable
+        self.from_ = from_
+        self.to = to
+        self.length = length
+        self.command = command
+
+        self._x0 = (int(kwargs['width']) - length) / 2
+        self._y = 85
+        self._pending = None
+        self._after_id = None
+
+        font = ("Helvetica", 10)
+        self.create_text(10, 12, text=question, anchor='w', 
+            font=("Helvetica", 11))
+        self.create_line(self._x0, self._y, self._x0 + length, self._y, 
+            width=4, fill='gray60', capstyle='round')
+        for idx, anchor in enumerate(anchors):
+            x = self._x0 + length * idx / max(len(anchors) - 1, 1)
+            self.create_line(x, self._y - 8, x, self._y + 8, fill='gray40')
+            self.create_text(x, 48, text=anchor, justify='center', font=font)
+        self._thumb = self.create_oval(0, 0, 0, 0, fill='steelblue', 
+            outline='gray20')
+        self._value_text = self.create_text(self._x0 + length / 2, 125, 
+            font=font)
+
+        self.bind('<Button-1>', self._on_pointer)
+        self.bind('<B1-Motion>', self._on_pointer)
+        self.bind('<Left>', lambda _: self._step(-1))
+        self.bind('<Right>', lambda _: self._step(1))
+        self.config(takefocus=1)
+        self.variable.trace_add('write', self._on_variable)
+        self._draw(self.variable.get())
+
+
+    def _on_pointer(self, event):
+        """ Store the pointer position; draw on next frame """
+        self.focus_set()
+        frac = (event.x - self._x0) / self.length
+        frac = min(max(frac, 0.0), 1.0)
+        self._schedule(self.from_ + frac * (self.to - self.from_))
+
+
+    def _step(self, delta):
+        """ Keyboard adjustment (from any value still
+            waiting for the next frame, so fast repeated
+            presses all count)
+        """
+        value = self._pending if self._pending is not None else self.variable.get()
+        self._schedule(value + delta)
+
+
+    def _schedule(self, value):
+        """ Coalesce updates to one per frame """
+        self._pending = int(round(min(max(value, self.from_), self.to)))
+        if self._after_id is None:
+            self._after_id = self.after(self.FRAME_MS, self._flush)
+
+
+    def _flush(self):
+        """ Apply the latest pending value """
+        self._after_id = None
+        value, self._pending = self._pending, None
+        if value is None or value == self.variable.get():
+            return
+        self.variable.set(value) # redraws via trace
+        if self.command is not None:
+            self.command(value)
+
+
+    def _on_variable(self, *_):
+        """ Redraw when the variable changes (e.g., reset) """
+        try:
+            self._draw(self.variable.get())
+        except tk.TclError:
+            pass
+
+
+    def _draw(self, value):
+        """ Move the thumb and update the value text """
+        frac = (value - self.from_) / (self.to - self.from_)
+        x = self._x0 + frac * self.length
+        r = 11
+        self.coords(self._thumb, x - r, self._y - r, x + r, self._y + r)
+        self.itemconfigure(self._value_text, text=f"Rating: {int(value)}")